@@ -0,0 +1,84 @@
+# Fingerprinted, precompressed static files.
+#
+# Every file under static/ is read once at startup, hashed and compressed
+# (gzip, and brotli when the brotli package is installed) at the highest
+# levels, since that is paid once rather than per request. url_for('static',
+# filename='css/style.css') then gives /static/css/style.<hash>.css, served
+# from memory with a year-long immutable Cache-Control: an edited file gets
+# a new URL, so browsers never revalidate the old one and a repeat visit
+# loads the page's assets from their cache without a single request.
+#
+# Plain filenames are served too, with no-cache and an ETag so they are
+# revalidated: the web app manifest, which browsers identify by its URL,
+# and pages rendered before a deploy asking for the old names. Edits to
+# static/ show up after a restart (the development server's reloader
+# watches the files).
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Served under their own name only
+UNVERSIONED = ('manifest.json',)
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Smaller files gain less from compression than the header costs
+MIN_COMPRESS_BYTES = 512
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/manifest+json', 'image/svg+xml')
+
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+
+
+class StaticAssets:
+    def __init__(self, folder):
+        self.folder = folder
+        self.paths = []
+        # Served filename -> {'mimetype', 'etag', 'cache_control', 'encodings': {encoding: bytes}}
+        self.files = {}
+        # Plain filename -> fingerprinted filename, for url_for
+        self.versions = {}
+        for root, _, names in os.walk(folder):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                self._add(os.path.relpath(path, folder).replace(os.sep, '/'), path)
+
+    def _add(self, filename, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        encodings = {'identity': data}
+        if len(data) >= MIN_COMPRESS_BYTES and mimetype.startswith(COMPRESSIBLE):
+            encodings['gzip'] = gzip.compress(data, 9, mtime=0)
+            if brotli is not None:
+                encodings['br'] = brotli.compress(data, quality=11)
+            # Keep only the copies that came out smaller
+            encodings = {
+                encoding: body for encoding, body in encodings.items()
+                if encoding == 'identity' or len(body) < len(data)
+            }
+
+        asset = {'mimetype': mimetype, 'etag': digest[:20], 'cache_control': REVALIDATE, 'encodings': encodings}
+        self.paths.append(path)
+        self.files[filename] = asset
+        if filename not in UNVERSIONED:
+            stem, extension = os.path.splitext(filename)
+            versioned = f'{stem}.{digest[:12]}{extension}'
+            self.files[versioned] = {**asset, 'cache_control': IMMUTABLE}
+            self.versions[filename] = versioned
+
+    def get(self, filename):
+        return self.files.get(filename)
+
+    def url_filename(self, filename):
+        # The fingerprinted name to link to; unknown files keep theirs (and 404)
+        return self.versions.get(filename, filename)
@@ -0,0 +1,170 @@
+# Batched, idempotent mutations for /api/batch.
+#
+# A batch is an ordered list of operations, each optionally carrying a
+# client-chosen idempotency key:
+#
+#     {"op": "add_user", "key": "k1", "name": "Ann"}
+#     {"op": "remove_user", "key": "k2", "user_id": "..."}
+#     {"op": "add_expense", "key": "k3", "payer_id": "...", "amount": "12.50",
+#      "description": "Taxi", "category": "Transportation",
+#      "split_type": "equal", "participants": [...], "values": {...}}
+#     {"op": "delete_expense", "key": "k4", "expense_id": "..."}
+#
+# The store applies the whole batch under one write (one lock hold, one
+# log sync, or one transaction) and returns one result per operation:
+# {"status": 201, "expense": {...}} or {"status": 409, "error": "..."}.
+# Operations see the effects of earlier ones, so a batch can add a member
+# and an expense they paid for. A failed operation does not stop the rest.
+#
+# Results are remembered by key in a bounded LRU, so a client retrying
+# after a lost response gets the original results back ("replayed": true)
+# instead of applying the operations twice. The cache lives in the process:
+# with several workers a retry is only recognised by the worker that saw
+# the key, and keys are forgotten on restart.
+
+import logging
+import threading
+from collections import OrderedDict
+
+from money import parse_cents
+from split_engine import resolve_split
+
+OPERATIONS = ('add_user', 'remove_user', 'add_expense', 'delete_expense')
+
+MAX_KEY_LENGTH = 200
+
+
+class IdempotencyCache:
+    def __init__(self, max_keys=10000):
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+        self.replays = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.replays += 1
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            if len(self._results) > self.max_keys:
+                self._results.popitem(last=False)
+
+
+def failure(status, message):
+    return {'status': status, 'error': message}
+
+
+def parse_operation(op):
+    # Checks what can be checked without the store. Returns the operation
+    # with its amount in cents, or a failure result to report as is.
+    if not isinstance(op, dict):
+        return failure(400, 'Each operation must be an object')
+    key = op.get('key')
+    if key is not None and (not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH):
+        return failure(400, f'key must be a string of 1 to {MAX_KEY_LENGTH} characters')
+    kind = op.get('op')
+    if kind not in OPERATIONS:
+        return failure(400, f'op must be one of {", ".join(OPERATIONS)}')
+
+    if kind == 'add_user':
+        name = str(op.get('name') or '').strip()
+        if not name:
+            return failure(400, 'Please enter a valid name')
+        return {'op': kind, 'key': key, 'name': name}
+    if kind == 'remove_user':
+        if not isinstance(op.get('user_id'), str):
+            return failure(400, 'user_id must be a string')
+        return {'op': kind, 'key': key, 'user_id': op['user_id']}
+    if kind == 'delete_expense':
+        if not isinstance(op.get('expense_id'), str):
+            return failure(400, 'expense_id must be a string')
+        return {'op': kind, 'key': key, 'expense_id': op['expense_id']}
+
+    try:
+        amount_cents = parse_cents(op.get('amount', '0'))
+        if amount_cents <= 0:
+            raise ValueError('Amount must be positive')
+    except (TypeError, ValueError):
+        return failure(400, 'Please enter a valid positive amount')
+    description = str(op.get('description') or '').strip()
+    if not description:
+        return failure(400, 'Please enter a description')
+    if not isinstance(op.get('payer_id'), str):
+        return failure(400, 'payer_id must be a string')
+    category = op.get('category') or 'Other'
+    split_type = op.get('split_type') or 'equal'
+    if not isinstance(category, str) or not isinstance(split_type, str):
+        return failure(400, 'category and split_type must be strings')
+    participants = op.get('participants')
+    values = op.get('values') or {}
+    if participants is not None and not (
+        isinstance(participants, list) and all(isinstance(user_id, str) for user_id in participants)
+    ):
+        return failure(400, 'Split participants must be a list of user ids')
+    if not isinstance(values, dict) or not all(isinstance(value, (str, int, float)) for value in values.values()):
+        return failure(400, 'Split values must map user ids to numbers')
+    return {
+        'op': kind,
+        'key': key,
+        'payer_id': op['payer_id'],
+        'amount_cents': amount_cents,
+        'description': description,
+        'category': category,
+        'split_type': split_type,
+        'participants': participants,
+        'values': values
+    }
+
+
+def expense_args(op, users, member_ids):
+    # add_expense arguments for a parsed operation, against the members as
+    # they stand at this point of the batch. Raises ValueError.
+    payer = users.get(op['payer_id'])
+    if payer is None:
+        raise ValueError('Selected user not found')
+    participants = op['participants'] or member_ids
+    if not set(participants) <= users.keys():
+        raise ValueError('Split participants must be members of the group')
+    splits = resolve_split(op['amount_cents'], op['split_type'], participants, op['values'])
+    return payer, op['amount_cents'], op['description'], op['category'], None, splits
+
+
+def run(group_id, operations, cache, apply):
+    # Applies parsed operations in order with apply(op) -> result, skipping
+    # keys already answered (in the cache or earlier in this batch). Returns
+    # (results, {key: result} to cache once the batch is committed). An
+    # operation that raises becomes a 500 result of its own: the others
+    # still apply and get cached, and its key is left for a retry.
+    results = []
+    answered = {}
+    for op in operations:
+        if 'error' in op:
+            results.append(op)
+            continue
+        key = op['key']
+        if key is not None:
+            previous = answered.get(key) or cache.get((group_id, key))
+            if previous is not None:
+                results.append({**previous, 'replayed': True})
+                continue
+        try:
+            result = apply(op)
+        except Exception:
+            logging.exception('Batch operation failed: %r', op)
+            results.append(failure(500, 'Operation failed'))
+            continue
+        if key is not None:
+            result['key'] = key
+            answered[key] = result
+        results.append(result)
+    return results, answered
@@ -0,0 +1,60 @@
+# Compare one POST per expense with the same expenses sent to /api/batch.
+#
+#     python benchmarks/bench_batch.py [expenses] [batch size]
+#
+# Adds the expenses through the Flask test client both ways, then sends
+# the last batch again to time a retry that is answered from the
+# idempotency cache. Run with DATA_DIR set to include the write-ahead
+# log's fsyncs, which a batch pays once instead of once per expense.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+
+
+def run():
+    expenses = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    client = main.app.test_client()
+
+    with main.app.app_context():
+        store = main.groups.create_group('bench-batch')
+        payer = store.add_user('You', is_current=True)
+        for i in range(1, 6):
+            store.add_user(f'User {i}')
+        group_id = store.group_id
+
+    start = time.perf_counter()
+    for n in range(expenses):
+        client.post('/api/expenses', json={
+            'payer_id': payer['id'], 'amount': '12.34', 'description': f'Single {n}', 'category': 'Food'
+        }, query_string={'group_id': group_id})
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for offset in range(0, expenses, size):
+        operations = [
+            {'op': 'add_expense', 'key': f'bench-{n}', 'payer_id': payer['id'], 'amount': '12.34',
+             'description': f'Batched {n}', 'category': 'Food'}
+            for n in range(offset, min(offset + size, expenses))
+        ]
+        client.post('/api/batch', json={'operations': operations}, query_string={'group_id': group_id})
+    batched = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = client.post('/api/batch', json={'operations': operations}, query_string={'group_id': group_id})
+    retry = time.perf_counter() - start
+    assert response.get_json()['applied'] == 0
+
+    print(f'{expenses} expenses, batches of {size}')
+    print(f'  one request each   {single:8.3f} s  {expenses / single:10,.0f} /s')
+    print(f'  /api/batch         {batched:8.3f} s  {expenses / batched:10,.0f} /s  ({single / batched:.1f}x)')
+    print(f'  retried batch      {retry * 1000:8.3f} ms (replayed from the idempotency cache)')
+
+
+if __name__ == '__main__':
+    run()
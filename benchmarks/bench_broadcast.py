@@ -0,0 +1,69 @@
+# Measure live-update fan-out to many idle listeners.
+#
+#     python benchmarks/bench_broadcast.py [listeners] [events]
+#
+# Opens that many /events streams on one group (each consumed by a thread
+# standing in for a browser connection), publishes events and reports how
+# long a publish takes and how long until every listener has received each
+# event. A publish only appends to the group's ring and notifies, so its
+# cost should not grow with the number of listeners.
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from broadcaster import Broadcaster
+
+
+def main():
+    listeners = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    broadcaster = Broadcaster(keepalive=1)
+    received = [0] * listeners
+    done = threading.Event()
+    pending = threading.Semaphore(0)
+
+    def listen(index):
+        stream = broadcaster.listen('bench')
+        next(stream)
+        pending.release()
+        for chunk in stream:
+            received[index] += chunk.count('event: ')
+            if received[index] >= events:
+                break
+        stream.close()
+        if all(count >= events for count in received):
+            done.set()
+
+    threads = [threading.Thread(target=listen, args=(i,), daemon=True) for i in range(listeners)]
+    for thread in threads:
+        thread.start()
+    for _ in range(listeners):
+        pending.acquire()
+    # Let every stream reach its wait
+    time.sleep(0.5)
+    print(f'{broadcaster.listeners} listeners connected')
+
+    publish_times = []
+    start = time.perf_counter()
+    for n in range(events):
+        began = time.perf_counter()
+        broadcaster.publish('bench', 'expense_added', {'n': n, 'row': 'x' * 500})
+        publish_times.append(time.perf_counter() - began)
+        time.sleep(0.001)
+    done.wait(60)
+    elapsed = time.perf_counter() - start
+
+    publish_times.sort()
+    print(f'publish: median {publish_times[len(publish_times) // 2] * 1e6:.1f} us, '
+          f'max {publish_times[-1] * 1e6:.1f} us')
+    print(f'{events} events to {listeners} listeners delivered in {elapsed:.2f} s '
+          f'({events * listeners / elapsed:,.0f} deliveries/s)')
+    print(f'all delivered: {done.is_set()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Peak memory and time-to-first-byte of the CSV export.
+#
+#     python benchmarks/bench_export.py [expenses]
+#
+# Compares the old approach (format everything into one StringIO) against
+# the streaming generator in export.py. Peak memory is measured with
+# tracemalloc after the store has been populated, so it only counts what
+# the export itself allocates.
+
+import csv
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from export import iter_csv, gzip_chunks
+from money import format_cents
+from store import InMemoryStore
+
+
+def build_store(count, seed=42):
+    rng = random.Random(seed)
+    store = InMemoryStore()
+    payers = [store.add_user(f'User {i}') for i in range(10)]
+    categories = ['Food', 'Rent', 'Transportation', 'Utilities', 'Other']
+    store.bulk_add_expenses(
+        (rng.choice(payers), rng.randint(1, 100000), f'Expense {i}', rng.choice(categories))
+        for i in range(count)
+    )
+    return store
+
+
+def export_buffered(store):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Date', 'Paid By', 'Description', 'Category', 'Amount'])
+    for expense in store.list_expenses():
+        writer.writerow([
+            expense['date'],
+            expense['payer_name'],
+            expense['description'],
+            expense.get('category', 'Other'),
+            f"${format_cents(expense['amount_cents'])}"
+        ])
+    output.seek(0)
+    yield output.getvalue()
+
+
+def export_streaming(store):
+    return iter_csv(store.iter_expenses())
+
+
+def export_streaming_gzip(store):
+    return gzip_chunks(iter_csv(store.iter_expenses()))
+
+
+def measure(name, export, store):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    for chunk in export(store):
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:>16} {peak / 1e6:>10.1f} {first_byte * 1000:>12.1f} {total:>9.2f} {size / 1e6:>9.1f}')
+
+
+def run(count):
+    print(f'Populating store with {count} expenses...')
+    store = build_store(count)
+    print(f"{'export':>16} {'peak MB':>10} {'1st byte ms':>12} {'total s':>9} {'out MB':>9}")
+    measure('buffered', export_buffered, store)
+    measure('streaming', export_streaming, store)
+    measure('streaming+gzip', export_streaming_gzip, store)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
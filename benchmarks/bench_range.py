@@ -0,0 +1,64 @@
+# Time-range queries against the sorted timestamp index.
+#
+#     python benchmarks/bench_range.py
+#
+# Builds a store with a year of expenses and compares a one-week listing
+# and a "balances as of" query with the equivalent full scans.
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from split_engine import compute_net_balances
+from store import InMemoryStore
+
+
+def build_store(count, seed=42):
+    rng = random.Random(seed)
+    store = InMemoryStore()
+    payers = [store.add_user(f'User {i}') for i in range(10)]
+    start = datetime(2025, 1, 1)
+    store.bulk_add_expenses(
+        (rng.choice(payers), rng.randint(1, 100000), f'Expense {i}', 'Other',
+         start + timedelta(seconds=rng.randint(0, 365 * 86400)))
+        for i in range(count)
+    )
+    return store
+
+
+def timed(function, repeats=20):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return result, (time.perf_counter() - start) / repeats * 1000
+
+
+def run(sizes=(10000, 100000)):
+    print(f"{'expenses':>9} {'query':>18} {'indexed ms':>11} {'scan ms':>9}")
+    for count in sizes:
+        store = build_store(count)
+        week_start, week_end = datetime(2025, 6, 1), datetime(2025, 6, 8)
+
+        indexed, indexed_ms = timed(lambda: list(store.iter_expenses(start=week_start, end=week_end)))
+        scanned, scan_ms = timed(lambda: [
+            expense for expense in store.list_expenses()
+            if week_start.timestamp() <= expense['timestamp'] < week_end.timestamp()
+        ])
+        assert len(indexed) == len(scanned)
+        print(f"{count:>9} {'one week listing':>18} {indexed_ms:>11.3f} {scan_ms:>9.3f}")
+
+        as_of = datetime(2025, 3, 1)
+        (_, indexed), indexed_ms = timed(lambda: store.balance_snapshot(as_of))
+        scanned, scan_ms = timed(lambda: compute_net_balances(list(store.users), [
+            expense for expense in store.list_expenses() if expense['timestamp'] < as_of.timestamp()
+        ]))
+        assert indexed == scanned
+        print(f"{count:>9} {'balances as of':>18} {indexed_ms:>11.3f} {scan_ms:>9.3f}")
+
+
+if __name__ == '__main__':
+    run()
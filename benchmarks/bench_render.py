@@ -0,0 +1,69 @@
+# Render time of the index page.
+#
+#     python benchmarks/bench_render.py [requests]
+#
+# "inline" reproduces the old behaviour: the template source is compiled on
+# every request (as render_template_string does) and the users panel and
+# balance sheet are rendered from scratch. "cached" is the current index()
+# with compiled templates and cached fragments.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from main import app
+
+
+def read_template(name):
+    with open(os.path.join(app.root_path, 'templates', name)) as f:
+        return f.read()
+
+
+def render_inline():
+    env = app.jinja_env
+    store = main.groups.default()
+    users = store.list_users()
+    users_panel = env.from_string(read_template('_users_panel.html')).render(users=users)
+    balance_sheet = env.from_string(read_template('_balance_sheet.html')).render(balances=main.calculate_balances(store))
+
+    expense_groups = []
+    for group in store.category_summaries():
+        group['expenses'], group['next_cursor'] = store.page_expenses(group['category'], limit=main.EXPENSE_PAGE_SIZE)
+        expense_groups.append(group)
+
+    # The page template includes _expense_rows.html through the loader, so
+    # only the outer template is recompiled here
+    return env.from_string(read_template('index.html')).render(
+        group={'id': store.group_id, 'name': store.group_name},
+        groups=main.groups.list_groups(),
+        users=users,
+        users_panel=users_panel,
+        balance_sheet=balance_sheet,
+        summary=store.expense_summary(),
+        expense_groups=expense_groups,
+        expense_categories=main.expense_categories
+    )
+
+
+def render_cached():
+    return main.index()
+
+
+def measure(name, render, requests):
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        render()
+        start = time.perf_counter()
+        for _ in range(requests):
+            render()
+        elapsed = time.perf_counter() - start
+    print(f'{name:>8} {elapsed / requests * 1000:>10.3f} ms/request')
+
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    measure('inline', render_inline, requests)
+    measure('cached', render_cached, requests)
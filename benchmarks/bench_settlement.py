@@ -0,0 +1,49 @@
+# Compare transfer count and runtime of the settlement engines.
+#
+#     python benchmarks/bench_settlement.py
+#
+# Balances are generated as several independent zero-sum clusters (as when
+# a group is really a few sub-groups sharing costs), which is where the
+# minimal engine can beat greedy.
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from settlement import SETTLEMENT_MODES
+
+
+def generate_balances(members, rng):
+    balances = {}
+    index = 0
+    while index < members:
+        size = min(rng.randint(2, 5), members - index)
+        if members - index - size == 1:
+            size += 1
+        values = [rng.randint(-50000, 50000) for _ in range(size - 1)]
+        values.append(-sum(values))
+        for value in values:
+            balances[f'user-{index}'] = value
+            index += 1
+    return balances
+
+
+def run(sizes=(5, 10, 15, 20, 25, 30), repeats=20, seed=42):
+    rng = random.Random(seed)
+    print(f"{'members':>8} {'mode':>8} {'transfers':>10} {'avg ms':>10}")
+    for members in sizes:
+        cases = [generate_balances(members, rng) for _ in range(repeats)]
+        for mode, engine in SETTLEMENT_MODES.items():
+            transfers = 0
+            start = time.perf_counter()
+            for balances in cases:
+                transfers += len(engine(balances))
+            elapsed = (time.perf_counter() - start) / repeats * 1000
+            print(f'{members:>8} {mode:>8} {transfers / repeats:>10.1f} {elapsed:>10.3f}')
+
+
+if __name__ == '__main__':
+    run()
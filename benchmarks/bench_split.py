@@ -0,0 +1,69 @@
+# Time a full balance recompute over a large expense history.
+#
+#     python benchmarks/bench_split.py
+#
+# Expenses use a mix of split rules over random subsets of the members.
+# Times the loop over expense dicts (what the SQL backend's /ledger/check
+# runs) and the NumPy reduction over the same expenses held in an
+# ExpenseTable's columns (the in-memory backend's check).
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from expense_table import ExpenseTable
+from split_engine import SPLIT_TYPES, compute_net_balances, np, resolve_split
+
+
+def generate_expenses(count, user_ids, rng):
+    expenses = []
+    for _ in range(count):
+        amount = rng.randint(100, 100000)
+        participants = rng.sample(user_ids, rng.randint(1, len(user_ids)))
+        split_type = rng.choice(SPLIT_TYPES)
+        if split_type == 'exact':
+            values = {user_id: 0 for user_id in participants}
+            values[participants[0]] = f'{amount / 100:.2f}'
+        elif split_type == 'percentage':
+            values = {user_id: 0 for user_id in participants}
+            values[participants[0]] = 100
+        else:
+            values = {user_id: rng.randint(1, 4) for user_id in participants}
+        expenses.append({
+            'payer_id': rng.choice(user_ids),
+            'amount_cents': amount,
+            'splits': resolve_split(amount, split_type, participants, values)
+        })
+    return expenses
+
+
+def run(sizes=(1000, 10000, 100000), members=20, seed=42):
+    rng = random.Random(seed)
+    user_ids = [f'user-{i}' for i in range(members)]
+    print(f"{'expenses':>9} {'engine':>7} {'ms':>10}")
+    for count in sizes:
+        expenses = generate_expenses(count, user_ids, rng)
+        start = time.perf_counter()
+        result = compute_net_balances(user_ids, expenses)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{count:>9} {'loop':>7} {elapsed:>10.2f}")
+        assert sum(result.values()) == 0
+        if np is not None:
+            table = ExpenseTable()
+            for i, expense in enumerate(expenses):
+                table.append(
+                    str(i), expense['payer_id'], expense['payer_id'], expense['amount_cents'], '', None, 0.0,
+                    expense['splits']
+                )
+            start = time.perf_counter()
+            columns = table.net_balances(user_ids)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{count:>9} {'columns':>7} {elapsed:>10.2f}")
+            assert columns == result
+
+
+if __name__ == '__main__':
+    run()
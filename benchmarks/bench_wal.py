@@ -0,0 +1,69 @@
+# Measure write throughput with the write-ahead log and group commit.
+#
+#     python benchmarks/bench_wal.py
+#
+# Several threads add expenses to their own groups at once, first purely in
+# memory and then with every write fsynced through the log. The appends per
+# fsync column shows how many writes each group commit covered. Finally the
+# data directory is replayed to time a restart.
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from groups import GroupRegistry
+from wal import WriteAheadLog
+
+
+def hammer(registry, threads, writes):
+    stores = []
+    for i in range(threads):
+        store = registry.create_group(f'group-{i}')
+        payer = store.add_user('You', is_current=True)
+        store.add_user('Friend')
+        stores.append((store, payer))
+
+    def worker(store, payer):
+        for n in range(writes):
+            store.add_expense(payer, 100 + n, 'bench', 'Food')
+
+    workers = [threading.Thread(target=worker, args=pair) for pair in stores]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def run(threads=(1, 4, 16), writes=500):
+    print(f"{'threads':>8} {'mode':>7} {'writes/s':>10} {'appends/fsync':>14}")
+    for count in threads:
+        elapsed = hammer(GroupRegistry(), count, writes)
+        print(f"{count:>8} {'memory':>7} {count * writes / elapsed:>10.0f} {'-':>14}")
+
+        directory = tempfile.mkdtemp(prefix='splitstack-wal-')
+        try:
+            log = WriteAheadLog(directory)
+            registry = GroupRegistry(log)
+            elapsed = hammer(registry, count, writes)
+            print(f"{count:>8} {'wal':>7} {count * writes / elapsed:>10.0f} {log.appends / max(log.fsyncs, 1):>14.1f}")
+            log.close()
+
+            start = time.perf_counter()
+            restored = GroupRegistry(WriteAheadLog(directory))
+            elapsed = time.perf_counter() - start
+            total = sum(store.expense_count() for store in restored.groups.values())
+            print(f"{'':>8} replayed {total} expenses in {elapsed * 1000:.1f} ms")
+            restored.log.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,59 @@
+# Seeded synthetic data for benchmarks.
+#
+#     from datagen import populate
+#     populate(store, users=20, expenses=100000, categories=main.expense_categories)
+#
+# The same seed always produces the same members, amounts, categories,
+# dates and splits, so numbers from different versions are comparable.
+# Expenses are spread over `days` days, paid by a random member and split
+# equally or by shares over a random subset of the group, and written with
+# bulk_add_expenses in batches, so it works on either store.
+
+import random
+from datetime import datetime, timedelta
+
+from split_engine import resolve_split
+
+START = datetime(2024, 1, 1)
+
+
+def generate(users, expenses, categories, seed=42, days=365):
+    # Yields (payer index, amount_cents, description, category, date,
+    # participant indexes, split_type, share values)
+    rng = random.Random(seed)
+    seconds = days * 24 * 3600
+    for n in range(expenses):
+        participants = rng.sample(range(users), rng.randint(2, min(users, 6)))
+        split_type = 'equal' if rng.random() < 0.7 else 'shares'
+        shares = [rng.randint(1, 4) for _ in participants] if split_type == 'shares' else None
+        yield (
+            rng.randrange(users),
+            rng.randint(100, 50000),
+            f'Expense {n}',
+            rng.choice(categories),
+            START + timedelta(seconds=rng.randrange(seconds)),
+            participants,
+            split_type,
+            shares
+        )
+
+
+def populate(store, users, expenses, categories, seed=42, days=365, batch=10000):
+    # Adds `users` members and `expenses` expenses; returns the members
+    members = [store.add_user('You', is_current=True)]
+    members += [store.add_user(f'User {i}') for i in range(1, users)]
+    member_ids = [member['id'] for member in members]
+
+    items = []
+    for payer, amount, description, category, date, participants, split_type, shares in generate(
+            users, expenses, categories, seed, days):
+        ids = [member_ids[i] for i in participants]
+        values = dict(zip(ids, shares)) if shares else None
+        splits = resolve_split(amount, split_type, ids, values)
+        items.append((members[payer], amount, description, category, date, splits))
+        if len(items) == batch:
+            store.bulk_add_expenses(items)
+            items = []
+    if items:
+        store.bulk_add_expenses(items)
+    return members
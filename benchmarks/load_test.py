@@ -0,0 +1,166 @@
+# Load test against a running server.
+#
+#     gunicorn -c gunicorn.conf.py &
+#     python benchmarks/load_test.py [--url http://127.0.0.1:8000]
+#                                    [--concurrency 32] [--duration 10]
+#                                    [--group-id ID] [--output results.json]
+#
+# Runs each scenario for `duration` seconds with `concurrency` client
+# threads, each on its own keep-alive connection:
+#   index   GET / for the group
+#   add     POST /expenses/add as a fetch client would (Accept: JSON, so a
+#           201 instead of a redirect and a second page load)
+# and reports requests per second, errors and latency percentiles. The
+# expenses added are deleted again through /api/batch afterwards.
+#
+# The client is Python too: past a few hundred requests per second it can
+# become the bottleneck, so check its CPU use or run copies of it from
+# another machine before reading the numbers as the server's limit.
+
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+
+def connect(url):
+    parts = urlsplit(url)
+    if parts.scheme == 'https':
+        return http.client.HTTPSConnection(parts.hostname, parts.port or 443, timeout=30)
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+
+def fetch(url, path, method='GET', body=None, headers=None):
+    connection = connect(url)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_scenario(url, concurrency, duration, request):
+    # request(connection, n) -> status, for one request on an open
+    # connection. Returns the scenario's figures.
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    deadline = time.perf_counter() + duration
+    start_line = threading.Barrier(concurrency + 1)
+
+    def client(index):
+        connection = connect(url)
+        start_line.wait()
+        n = 0
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            try:
+                status = request(connection, index * 1000000 + n)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = connect(url)
+                status = None
+            if status is None or status >= 400:
+                errors[index] += 1
+            else:
+                latencies[index].append(time.perf_counter() - began)
+            n += 1
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start_line.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latency for per_client in latencies for latency in per_client)
+    return {
+        'requests': len(ordered),
+        'errors': sum(errors),
+        'requests_per_second': len(ordered) / elapsed,
+        'p50_ms': percentile(ordered, 0.50) * 1000 if ordered else None,
+        'p90_ms': percentile(ordered, 0.90) * 1000 if ordered else None,
+        'p99_ms': percentile(ordered, 0.99) * 1000 if ordered else None,
+        'max_ms': ordered[-1] * 1000 if ordered else None
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(description='SplitStack load test')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--group-id')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    group_id = args.group_id
+    if not group_id:
+        status, body = fetch(args.url, '/api/groups')
+        group_id = json.loads(body)['groups'][0]['id']
+    status, body = fetch(args.url, f'/api/users?group_id={group_id}')
+    payer_id = json.loads(body)['users'][0]['id']
+
+    def index(connection, n):
+        connection.request('GET', f'/?group_id={group_id}')
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+    added = []
+
+    def add(connection, n):
+        form = urlencode({
+            'group_id': group_id, 'payer_id': payer_id, 'amount': '12.34',
+            'description': f'Load test {n}', 'category': 'Other'
+        })
+        connection.request('POST', '/expenses/add', body=form, headers={
+            'Content-Type': 'application/x-www-form-urlencoded', 'Accept': 'application/json'
+        })
+        response = connection.getresponse()
+        body = response.read()
+        if response.status == 201:
+            added.append(json.loads(body)['id'])
+        return response.status
+
+    results = {
+        'meta': {'url': args.url, 'concurrency': args.concurrency, 'duration': args.duration},
+        'scenarios': {}
+    }
+    for name, request in (('index', index), ('add', add)):
+        print(f'{name}: {args.concurrency} clients for {args.duration:g}s...', file=sys.stderr)
+        results['scenarios'][name] = figures = run_scenario(args.url, args.concurrency, args.duration, request)
+        print(
+            f"  {figures['requests_per_second']:9,.1f} req/s  p50 {figures['p50_ms'] or 0:7.1f} ms"
+            f"  p99 {figures['p99_ms'] or 0:7.1f} ms  errors {figures['errors']}",
+            file=sys.stderr
+        )
+
+    # Leave the group as it was
+    for offset in range(0, len(added), 1000):
+        operations = [{'op': 'delete_expense', 'expense_id': expense_id} for expense_id in added[offset:offset + 1000]]
+        fetch(args.url, f'/api/batch?group_id={group_id}', 'POST', json.dumps({'operations': operations}),
+              {'Content-Type': 'application/json'})
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,103 @@
+# Hammer the routes from many threads and check nothing was corrupted.
+#
+#     python benchmarks/stress_routes.py [threads] [requests per thread]
+#
+# Every thread mixes page loads, API reads and CSV exports with adding and
+# removing members, adding and deleting expenses, and the occasional clear
+# or reset, all on the same group. Afterwards the running ledger must still
+# match a full recompute, balances must sum to zero, and no request may
+# have failed with a server error. Set STORAGE_BACKEND=sql to run against
+# the database store.
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+
+# Switch threads far more often than the default to shake out races
+sys.setswitchinterval(1e-5)
+logging.disable(logging.WARNING)
+
+
+def worker(seed, count, failures):
+    rng = random.Random(seed)
+    client = main.app.test_client()
+    for _ in range(count):
+        op = rng.random()
+        if op < 0.25:
+            response = client.get('/')
+        elif op < 0.35:
+            response = client.get('/api/balances')
+        elif op < 0.4:
+            response = client.get('/export/csv')
+            response.get_data()
+        elif op < 0.45:
+            response = client.post('/users/add', data={'name': f'user-{rng.randint(0, 20)}'})
+        elif op < 0.5:
+            users = [user for user in client.get('/api/users').get_json()['users'] if not user['is_current']]
+            if not users:
+                continue
+            response = client.post('/users/remove', data={'user_id': rng.choice(users)['id']})
+        elif op < 0.85:
+            users = client.get('/api/users').get_json()['users']
+            if not users:
+                continue
+            participants = [user['id'] for user in rng.sample(users, rng.randint(1, len(users)))]
+            response = client.post('/api/expenses', json={
+                'payer_id': rng.choice(users)['id'],
+                'amount': f'{rng.randint(1, 50000) / 100:.2f}',
+                'description': 'stress',
+                'category': rng.choice(main.expense_categories),
+                'participants': participants
+            })
+        elif op < 0.995:
+            expenses = client.get('/api/expenses').get_json()['expenses']
+            if not expenses:
+                continue
+            response = client.delete(f"/api/expenses/{rng.choice(expenses)['id']}")
+        elif op < 0.998:
+            response = client.post('/expenses/clear')
+        else:
+            response = client.post('/reset')
+
+        if response.status_code >= 500:
+            failures.append((response.request.path, response.status_code))
+
+
+def run(threads=16, requests=300):
+    failures = []
+    workers = [
+        threading.Thread(target=worker, args=(seed, requests, failures))
+        for seed in range(threads)
+    ]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    client = main.app.test_client()
+    check = client.get('/ledger/check').get_json()
+    balances = client.get('/api/balances').get_json()['net_cents']
+    expenses = client.get('/api/expenses').get_json()['expenses']
+
+    print(f'{threads * requests} requests from {threads} threads in {elapsed:.1f}s')
+    print(f'{len(expenses)} expenses, {len(balances)} members left')
+    print(f'server errors: {len(failures)}')
+    print(f'ledger consistent: {check["consistent"]}')
+    print(f'balances sum to zero: {sum(balances.values()) == 0}')
+    return not failures and check['consistent'] and sum(balances.values()) == 0
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    if main.app.config['STORAGE_BACKEND'] == 'sql':
+        main.app.app_context().push()
+    sys.exit(0 if run(*args) else 1)
@@ -0,0 +1,201 @@
+# Benchmark suite for the hot paths, with JSON results.
+#
+#     python benchmarks/suite.py [--sizes 1000,100000,1000000] [--users 20]
+#                                [--seed 42] [--output results.json]
+#                                [--compare baseline.json]
+#
+# For each size a new group is filled by datagen.populate (same seed, same
+# data), then timed through the Flask test client like real requests:
+#   populate      seconds to generate and bulk-add everything (with
+#                 tracemalloc running on the memory backend, so only
+#                 comparable to other runs of this suite)
+#   memory_bytes  Python memory the group holds (tracemalloc, memory backend)
+#   balances      calculate_balances()
+#   index_cold    GET / with the fragment cache cleared
+#   index_warm    GET / again, fragments cached
+#   export        GET /export/csv, whole body streamed
+#   search        GET /api/expenses/search for a word in every description
+#                 plus a number prefix, matching about one in nine
+#   statements    GET /api/balances/history for the month ends of the
+#                 generated year
+#   add / delete  POST /expenses/add and /expenses/delete, requests per second
+# Timings are the median of --repeats runs. With --compare, each figure is
+# also printed as a ratio to a previous results file, inverted for
+# throughput so that above 1 is always worse. Set STORAGE_BACKEND=sql to run
+# against the database store.
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from statistics import median
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from datagen import START, populate
+
+logging.disable(logging.WARNING)
+
+# Higher is better for these; everything else is a duration
+THROUGHPUT = ('add_per_second', 'delete_per_second')
+
+
+def timed(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return median(times)
+
+
+def throughput(function, count):
+    start = time.perf_counter()
+    for n in range(count):
+        function(n)
+    return count / (time.perf_counter() - start)
+
+
+def bench_size(client, size, users, seed, repeats, writes):
+    result = {'expenses': size}
+    memory = app_backend() == 'memory'
+
+    with main.app.app_context():
+        store = main.groups.create_group(f'bench-{size}')
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        members = populate(store, users, size, main.expense_categories, seed)
+        result['populate_seconds'] = time.perf_counter() - start
+        if memory:
+            result['memory_bytes'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+        group_id = store.group_id
+
+    with main.app.test_request_context(f'/?group_id={group_id}'):
+        main.app.preprocess_request()
+        result['balances_seconds'] = timed(lambda: main.calculate_balances(main.g.store), repeats)
+
+    def index_cold():
+        main.fragments.clear()
+        client.get(f'/?group_id={group_id}')
+
+    result['index_cold_seconds'] = timed(index_cold, repeats)
+    result['index_warm_seconds'] = timed(lambda: client.get(f'/?group_id={group_id}'), repeats)
+
+    def export():
+        response = client.get(f'/export/csv?group_id={group_id}', buffered=False)
+        result['export_bytes'] = sum(len(chunk) for chunk in response.response)
+        response.close()
+
+    result['export_seconds'] = timed(export, max(1, repeats // 5))
+    result['search_seconds'] = timed(
+        lambda: client.get(f'/api/expenses/search?group_id={group_id}&q=expense+12'), repeats
+    )
+
+    result['statements_seconds'] = timed(lambda: client.get(
+        f'/api/balances/history?group_id={group_id}&period=month&start={START:%Y-%m-%d}&end={START.year}-12-31'
+    ), repeats)
+
+    payer_id = members[0]['id']
+    added = []
+
+    def add(n):
+        response = client.post('/expenses/add', data={
+            'group_id': group_id, 'payer_id': payer_id, 'amount': '12.34',
+            'description': f'Bench {n}', 'category': 'Food'
+        }, headers={'Accept': 'application/json'})
+        added.append(response.get_json()['id'])
+
+    def delete(n):
+        client.post('/expenses/delete', data={'group_id': group_id, 'expense_id': added[n]},
+                    headers={'Accept': 'application/json'})
+
+    result['add_per_second'] = throughput(add, writes)
+    result['delete_per_second'] = throughput(delete, writes)
+
+    if memory:
+        # Let the next size start from a clean heap
+        del main.groups.groups[group_id]
+    return result
+
+
+def app_backend():
+    return main.app.config['STORAGE_BACKEND']
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=main.app.root_path, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    old = {row['expenses']: row for row in baseline['results']}
+    for row in results['results']:
+        previous = old.get(row['expenses'])
+        if not previous:
+            continue
+        print(f"{row['expenses']:>9,} expenses vs {baseline['meta'].get('revision')}:", file=sys.stderr)
+        for key, value in row.items():
+            if key == 'expenses' or not previous.get(key) or not isinstance(value, (int, float)):
+                continue
+            ratio = value / previous[key]
+            if key in THROUGHPUT:
+                ratio = 1 / ratio
+            flag = '  <-- worse' if ratio > 1.1 else ''
+            print(f'    {key:<20} {ratio:6.2f}x{flag}', file=sys.stderr)
+
+
+def run():
+    parser = argparse.ArgumentParser(description='SplitStack benchmark suite')
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    client = main.app.test_client()
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'backend': app_backend(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'users': args.users,
+            'seed': args.seed,
+            'repeats': args.repeats
+        },
+        'results': []
+    }
+    for size in (int(size) for size in args.sizes.split(',')):
+        print(f'{size:,} expenses...', file=sys.stderr)
+        results['results'].append(bench_size(client, size, args.users, args.seed, args.repeats, args.writes))
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,98 @@
+# Fan-out of live updates to connected browsers (Server-Sent Events).
+#
+# Each group has one bounded ring of recent events. Publishing formats the
+# event once, appends it to the ring and wakes the waiting streams with a
+# single notify_all. A subscriber keeps nothing but the id of the last event
+# it sent and reads newer ones straight from the shared ring, so a publish
+# costs the same with one listener or hundreds and idle listeners hold no
+# queue. A browser that reconnects with Last-Event-ID gets what it missed,
+# or a 'reload' event when it fell further behind than the ring reaches.
+#
+# Streams wait on a threading.Condition with a timeout and send a comment
+# line as keepalive. Under gevent's monkey patching that wait is a greenlet
+# switch, so with gevent workers an open stream is a greenlet, not a thread;
+# under the threaded development server each open stream still holds one
+# request thread.
+
+import json
+import threading
+from collections import deque
+
+
+def format_event(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class _Channel:
+    def __init__(self, history):
+        self.cond = threading.Condition()
+        self.events = deque(maxlen=history)
+        self.seq = 0
+        self.listeners = 0
+
+    def since(self, last_id):
+        # Formatted events after last_id, or None when they are gone
+        missed = self.seq - last_id
+        if missed < 0 or missed > len(self.events):
+            return None
+        return [self.events[i] for i in range(len(self.events) - missed, len(self.events))]
+
+
+class Broadcaster:
+    def __init__(self, history=256, keepalive=15):
+        self.history = history
+        # Seconds between keepalive comments on an idle stream
+        self.keepalive = keepalive
+        self._channels = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def _channel(self, group_id):
+        channel = self._channels.get(group_id)
+        if channel is None:
+            with self._lock:
+                channel = self._channels.setdefault(group_id, _Channel(self.history))
+        return channel
+
+    @property
+    def listeners(self):
+        # Open streams across all groups, for monitoring
+        return sum(channel.listeners for channel in list(self._channels.values()))
+
+    def has_listeners(self, group_id):
+        channel = self._channels.get(group_id)
+        return channel is not None and channel.listeners > 0
+
+    def publish(self, group_id, event, data):
+        channel = self._channel(group_id)
+        with channel.cond:
+            channel.seq += 1
+            channel.events.append(format_event(channel.seq, event, data))
+            self.published += 1
+            channel.cond.notify_all()
+            return channel.seq
+
+    def listen(self, group_id, last_id=None):
+        # Generator of SSE text for one client; ends when the client goes away
+        channel = self._channel(group_id)
+        with channel.cond:
+            channel.listeners += 1
+            if last_id is None:
+                last_id = channel.seq
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                with channel.cond:
+                    if channel.seq == last_id:
+                        channel.cond.wait(self.keepalive)
+                    events = channel.since(last_id)
+                    last_id = channel.seq
+                if events is None:
+                    yield format_event(last_id, 'reload', {})
+                elif events:
+                    yield ''.join(events)
+                else:
+                    yield ': keepalive\n\n'
+        finally:
+            with channel.cond:
+                channel.listeners -= 1
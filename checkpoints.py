@@ -0,0 +1,60 @@
+# Checkpointed balances for point-in-time queries.
+#
+# The ledger only knows the balances as they are now. For "as of" queries
+# the store's timeline (every expense in time order) is cut into runs of
+# `every` expenses, and the net balances at the start of each run are kept:
+# checkpoint i sums the first i * every expenses. The balances before any
+# moment are then its nearest earlier checkpoint plus a replay of fewer
+# than `every` expenses, however long the history is.
+#
+# Checkpoints are built on the first query that needs them, in one pass
+# over the table columns. Expenses added at the end of the timeline (the
+# usual case) leave every checkpoint valid; one inserted or deleted further
+# back shifts the positions after it, so the checkpoints from there on are
+# dropped and rebuilt by the next query.
+
+import threading
+
+CHECKPOINT_EVERY = 1024
+
+
+class BalanceCheckpoints:
+    def __init__(self, every=CHECKPOINT_EVERY):
+        self.every = every
+        # points[i] is {user_id: net cents} over timeline[:i * every]
+        self.points = [{}]
+        # Queries run under the store's read lock, possibly several at once,
+        # and building checkpoints must not interleave
+        self._lock = threading.Lock()
+
+    def invalidate(self, position):
+        # An expense was inserted at or removed from `position` of the
+        # timeline; runs under the store's write lock
+        del self.points[position // self.every + 1:]
+
+    def net_before(self, table, timeline, position):
+        # {user_id: net cents} over timeline[:position]
+        index = position // self.every
+        with self._lock:
+            if index >= len(self.points):
+                self._extend(table, timeline)
+            net = dict(self.points[index])
+        start = index * self.every
+        if start < position:
+            rows = table.rows
+            replay = [rows[key[1]] for key in timeline[start:position]]
+            for user_id, cents in table.net_by_chunks(replay, self.every)[0].items():
+                net[user_id] = net.get(user_id, 0) + cents
+        return net
+
+    def _extend(self, table, timeline):
+        # Checkpoints for every complete run of the timeline
+        start = (len(self.points) - 1) * self.every
+        end = len(timeline) - len(timeline) % self.every
+        rows = table.rows
+        net = self.points[-1]
+        for delta in table.net_by_chunks([rows[key[1]] for key in timeline[start:end]], self.every):
+            net = dict(net)
+            for user_id, cents in delta.items():
+                net[user_id] = net.get(user_id, 0) + cents
+            self.points.append(net)
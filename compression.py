@@ -0,0 +1,84 @@
+# Response compression for pages, JSON and CSV.
+#
+# Runs after every request: bodies of the listed types are gzipped (or
+# brotli-compressed when the brotli package is installed and the client
+# prefers it) whenever Accept-Encoding allows. Streamed bodies, like a
+# large /export/csv, are compressed chunk by chunk as they go out, so memory
+# use stays flat. Live update streams are left alone: their events must
+# reach the page as soon as they are written.
+#
+# A compressed body is a different set of bytes, so a strong ETag is
+# turned into a weak one; conditional requests compare weakly.
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/html', 'application/json', 'text/csv')
+
+# Below this the saving is not worth the CPU
+MIN_COMPRESS_BYTES = 1024
+
+# Per-request levels trade a little ratio for speed; static files are
+# compressed once at the highest levels instead (assets.py)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings, available):
+    # The client's most preferred of the available encodings, else identity
+    return accept_encodings.best_match([encoding for encoding in ENCODINGS if encoding in available]) or 'identity'
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return zlib.compress(data, GZIP_LEVEL, 31)
+
+
+def compress_chunks(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    # wbits=31 produces a gzip container rather than a raw zlib stream
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_response(response, accept_encodings):
+    if (response.mimetype not in COMPRESSIBLE_TYPES or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encodings, ENCODINGS)
+    if encoding == 'identity':
+        return response
+
+    if response.is_streamed:
+        response.response = compress_chunks(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_BYTES:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
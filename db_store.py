@@ -0,0 +1,688 @@
+# SQLAlchemy-backed repository, a drop-in replacement for InMemoryStore.
+#
+# Balances are computed with SQL aggregates (SUM ... GROUP BY user_id over the
+# expenses and their shares) so the database does the heavy lifting instead
+# of a Python loop over every row. Analytics come from the ExpenseRollup
+# table, balances as of a past moment from the BalanceDay table and search
+# from the ExpenseTerm word index, all updated by every expense write in the
+# same transaction.
+# Every query is scoped to one group through the group_id indexes.
+# All methods expect to run inside a Flask app context.
+#
+# Each thread gets its own session, and checks that must not race with
+# other writers (duplicate names, removing a member who is in use) run after
+# the group's DataVersion row has been updated: that row lock serialises
+# writers to the same group until the transaction commits.
+
+import uuid
+from datetime import date, datetime
+
+from sqlalchemy import and_, func, insert, or_
+
+import batch
+from ledger import check_consistency
+from models import db, Group, User, Expense, ExpenseShare, ExpenseRollup, ExpenseTerm, BalanceDay, DataVersion
+from rollups import Rollups
+from search_index import PREFIX_END, facets, tokenize
+from split_engine import resolve_split
+
+# Expense ids per IN (...) query when loading shares, under SQLite's variable limit
+SHARE_BATCH_SIZE = 500
+
+
+class SQLGroupRegistry:
+    def __init__(self, app):
+        with app.app_context():
+            db.create_all()
+            # Databases from before the rollup table existed need a backfill
+            if db.session.scalar(db.select(ExpenseRollup.group_id).limit(1)) is None:
+                for group in db.session.scalars(db.select(Group)).all():
+                    SQLStore(group.id, group.name).rebuild_rollups()
+            # ... and the same for the search index and the daily balances
+            if db.session.scalar(db.select(ExpenseTerm.group_id).limit(1)) is None:
+                for group in db.session.scalars(db.select(Group)).all():
+                    SQLStore(group.id, group.name).rebuild_terms()
+            if db.session.scalar(db.select(BalanceDay.group_id).limit(1)) is None:
+                for group in db.session.scalars(db.select(Group)).all():
+                    SQLStore(group.id, group.name).rebuild_balance_days()
+
+    def list_groups(self):
+        groups = db.session.scalars(db.select(Group).order_by(Group.created_at))
+        return [{'id': group.id, 'name': group.name} for group in groups]
+
+    def create_group(self, name):
+        group = Group(id=str(uuid.uuid4()), name=name, created_at=datetime.now())
+        db.session.add(group)
+        db.session.add(DataVersion(group_id=group.id, users=0, expenses=0))
+        db.session.commit()
+        return SQLStore(group.id, group.name)
+
+    def get(self, group_id):
+        group = db.session.get(Group, group_id) if group_id else None
+        return SQLStore(group.id, group.name) if group else None
+
+    def default(self):
+        group = db.session.scalar(db.select(Group).order_by(Group.created_at).limit(1))
+        return SQLStore(group.id, group.name) if group else None
+
+    def sizes(self):
+        return {
+            'groups': db.session.scalar(db.select(func.count(Group.id))),
+            'users': db.session.scalar(db.select(func.count(User.id))),
+            'expenses': db.session.scalar(db.select(func.count(Expense.id)))
+        }
+
+
+class SQLStore:
+    def __init__(self, group_id, group_name):
+        self.group_id = group_id
+        self.group_name = group_name
+
+    def _bump(self, users=0, expenses=0):
+        db.session.execute(
+            db.update(DataVersion)
+            .where(DataVersion.group_id == self.group_id)
+            .values(users=DataVersion.users + users, expenses=DataVersion.expenses + expenses)
+        )
+
+    def versions(self):
+        return tuple(db.session.execute(
+            db.select(DataVersion.users, DataVersion.expenses).where(DataVersion.group_id == self.group_id)
+        ).one())
+
+    def _users(self):
+        return db.select(User).where(User.group_id == self.group_id)
+
+    def _expenses(self):
+        return db.select(Expense, User.name).join(User).where(Expense.group_id == self.group_id)
+
+    @staticmethod
+    def _user_dict(user):
+        return {
+            'id': user.id,
+            'name': user.name,
+            'is_current': user.is_current
+        }
+
+    def _member_ids(self):
+        # Members in a stable order so leftover cents always land on the same users
+        return db.session.scalars(
+            db.select(User.id).where(User.group_id == self.group_id).order_by(User.is_current.desc(), User.name)
+        ).all()
+
+    @staticmethod
+    def _expense_dict(expense, payer_name, splits=None):
+        return {
+            'id': expense.id,
+            'payer_id': expense.user_id,
+            'payer_name': payer_name,
+            'amount_cents': expense.amount_cents,
+            'description': expense.description,
+            'category': expense.category,
+            'timestamp': expense.date.timestamp(),
+            'date': expense.date.strftime('%Y-%m-%d %H:%M'),
+            'splits': splits or {}
+        }
+
+    def _with_splits(self, rows):
+        # Turns (Expense, payer_name) rows into dicts, loading the shares with
+        # one query per SHARE_BATCH_SIZE expenses instead of one per expense
+        splits = {expense.id: {} for expense, _ in rows}
+        expense_ids = list(splits)
+        for offset in range(0, len(expense_ids), SHARE_BATCH_SIZE):
+            shares = db.session.execute(
+                db.select(ExpenseShare.expense_id, ExpenseShare.user_id, ExpenseShare.amount_cents)
+                .where(ExpenseShare.expense_id.in_(expense_ids[offset:offset + SHARE_BATCH_SIZE]))
+            )
+            for expense_id, user_id, cents in shares:
+                splits[expense_id][user_id] = cents
+        return [self._expense_dict(expense, payer_name, splits[expense.id]) for expense, payer_name in rows]
+
+    def _term_rows(self, expense_id, description):
+        return [
+            {'group_id': self.group_id, 'term': term, 'expense_id': expense_id}
+            for term in tokenize(description)
+        ]
+
+    def _share_rows(self, expense_id, splits):
+        return [
+            {'expense_id': expense_id, 'user_id': user_id, 'group_id': self.group_id, 'amount_cents': cents}
+            for user_id, cents in splits.items()
+        ]
+
+    # Users
+
+    def list_users(self):
+        users = db.session.scalars(self._users().order_by(User.is_current.desc(), User.name))
+        return [self._user_dict(user) for user in users]
+
+    def user_count(self):
+        return db.session.scalar(db.select(func.count(User.id)).where(User.group_id == self.group_id))
+
+    def get_user(self, user_id):
+        if not user_id:
+            return None
+        user = db.session.get(User, user_id)
+        return self._user_dict(user) if user and user.group_id == self.group_id else None
+
+    def find_user_by_name(self, name):
+        user = db.session.scalar(self._users().where(func.lower(User.name) == name.lower()))
+        return self._user_dict(user) if user else None
+
+    def add_user(self, name, is_current=False):
+        self._bump(users=1)
+        if self.find_user_by_name(name):
+            db.session.rollback()
+            raise ValueError(f'User "{name}" already exists')
+        user = self._insert_user(name, is_current)
+        db.session.commit()
+        return user
+
+    def _insert_user(self, name, is_current=False):
+        user = User(id=str(uuid.uuid4()), group_id=self.group_id, name=name, is_current=is_current)
+        db.session.add(user)
+        return self._user_dict(user)
+
+    def remove_user(self, user_id):
+        # Refuses (ValueError) while the user is part of any expense
+        user = db.session.get(User, user_id)
+        if not user or user.group_id != self.group_id:
+            return None
+        self._bump(users=1)
+        if self.has_expenses(user_id):
+            db.session.rollback()
+            raise ValueError(f'{user.name} is part of recorded expenses')
+        removed = self._user_dict(user)
+        db.session.delete(user)
+        db.session.commit()
+        return removed
+
+    def has_expenses(self, user_id):
+        # True if the user paid for or has a share in any expense
+        if db.session.scalar(db.select(Expense.id).where(Expense.user_id == user_id).limit(1)) is not None:
+            return True
+        return db.session.scalar(
+            db.select(ExpenseShare.expense_id).where(ExpenseShare.user_id == user_id).limit(1)
+        ) is not None
+
+    # Expenses
+
+    def list_expenses(self):
+        rows = db.session.execute(
+            self._expenses().order_by(Expense.date, Expense.id)
+        ).all()
+        return self._with_splits(rows)
+
+    def iter_expenses(self, start=None, end=None, category=None, payer_id=None):
+        # Server-side filtered query, fetched in chunks rather than all at once.
+        # start (inclusive) and end (exclusive) are datetimes; the range is
+        # served by the (group_id, date) index.
+        query = self._expenses().order_by(Expense.date, Expense.id)
+        if start:
+            query = query.where(Expense.date >= start)
+        if end:
+            query = query.where(Expense.date < end)
+        if category:
+            query = query.where(Expense.category == category)
+        if payer_id:
+            query = query.where(Expense.user_id == payer_id)
+
+        rows = db.session.execute(query.execution_options(yield_per=1000))
+        for chunk in rows.partitions():
+            yield from self._with_splits(chunk)
+
+    def expense_count(self):
+        return db.session.scalar(db.select(func.count(Expense.id)).where(Expense.group_id == self.group_id))
+
+    def expense_changes(self, since):
+        # No change journal in the database; clients always get a full listing
+        return None
+
+    def expense_summary(self):
+        count, total = db.session.execute(
+            db.select(func.count(Expense.id), func.coalesce(func.sum(Expense.amount_cents), 0))
+            .where(Expense.group_id == self.group_id)
+        ).one()
+        return {'count': count, 'total_cents': total}
+
+    def category_summaries(self):
+        category = func.coalesce(Expense.category, 'Other')
+        rows = db.session.execute(
+            db.select(category, func.count(Expense.id), func.sum(Expense.amount_cents))
+            .where(Expense.group_id == self.group_id)
+            .group_by(category)
+            .order_by(func.min(Expense.date))
+        )
+        return [{'category': name, 'count': count, 'total_cents': total} for name, count, total in rows]
+
+    def page_expenses(self, category, cursor=None, limit=50):
+        # Keyset pagination on the (date, id) order, served by the date index
+        query = (
+            self._expenses()
+            .where(func.coalesce(Expense.category, 'Other') == category)
+            .order_by(Expense.date, Expense.id)
+            .limit(limit + 1)
+        )
+        if cursor:
+            # A cursor that doesn't parse starts from the beginning, as in
+            # the in-memory store
+            moment, _, expense_id = cursor.partition('|')
+            try:
+                moment = datetime.fromisoformat(moment)
+            except ValueError:
+                moment = None
+            if moment is not None:
+                query = query.where(or_(
+                    Expense.date > moment,
+                    and_(Expense.date == moment, Expense.id > expense_id)
+                ))
+        rows = db.session.execute(query).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1][0]
+            next_cursor = f'{last.date.isoformat()}|{last.id}'
+        return self._with_splits(rows), next_cursor
+
+    def get_expense(self, expense_id):
+        row = db.session.execute(
+            self._expenses().where(Expense.id == expense_id)
+        ).first()
+        return self._with_splits([row])[0] if row else None
+
+    def _roll(self, expenses, sign):
+        # Adds (sign 1) or removes (sign -1) a list of expense dicts from the
+        # rollup and daily balance tables. Callers bump the version first,
+        # which locks out other writers to the group, so the update-or-insert
+        # cannot race.
+        self._roll_totals(expenses, sign)
+        self._roll_balances(expenses, sign)
+
+    def _roll_totals(self, expenses, sign):
+        deltas = Rollups()
+        for expense in expenses:
+            deltas.record(expense, sign)
+        for dimension, table in deltas.tables():
+            for bucket, totals in table.items():
+                where = (
+                    ExpenseRollup.group_id == self.group_id,
+                    ExpenseRollup.dimension == dimension,
+                    ExpenseRollup.bucket == bucket
+                )
+                updated = db.session.execute(
+                    db.update(ExpenseRollup).where(*where).values(
+                        count=ExpenseRollup.count + totals['count'],
+                        total_cents=ExpenseRollup.total_cents + totals['total_cents']
+                    )
+                )
+                if not updated.rowcount:
+                    db.session.add(ExpenseRollup(
+                        group_id=self.group_id, dimension=dimension, bucket=bucket,
+                        count=totals['count'], total_cents=totals['total_cents']
+                    ))
+        db.session.flush()
+        if sign < 0:
+            db.session.execute(db.delete(ExpenseRollup).where(
+                ExpenseRollup.group_id == self.group_id, ExpenseRollup.count == 0
+            ))
+
+    def _roll_balances(self, expenses, sign):
+        deltas = {}
+        for expense in expenses:
+            day = date.fromisoformat(expense['date'][:10])
+            key = (day, expense['payer_id'])
+            deltas[key] = deltas.get(key, 0) + sign * expense['amount_cents']
+            for user_id, cents in expense['splits'].items():
+                deltas[(day, user_id)] = deltas.get((day, user_id), 0) - sign * cents
+        for (day, user_id), cents in deltas.items():
+            if not cents:
+                continue
+            updated = db.session.execute(
+                db.update(BalanceDay).where(
+                    BalanceDay.group_id == self.group_id, BalanceDay.day == day, BalanceDay.user_id == user_id
+                ).values(net_cents=BalanceDay.net_cents + cents)
+            )
+            if not updated.rowcount:
+                db.session.add(BalanceDay(group_id=self.group_id, day=day, user_id=user_id, net_cents=cents))
+        db.session.flush()
+        if sign < 0:
+            # Rows that came back to zero would keep a member from being removed
+            db.session.execute(db.delete(BalanceDay).where(
+                BalanceDay.group_id == self.group_id, BalanceDay.net_cents == 0
+            ))
+
+    def rebuild_terms(self):
+        db.session.execute(db.delete(ExpenseTerm).where(ExpenseTerm.group_id == self.group_id))
+        rows = db.session.execute(
+            db.select(Expense.id, Expense.description).where(Expense.group_id == self.group_id)
+        )
+        terms = [term for expense_id, description in rows for term in self._term_rows(expense_id, description)]
+        if terms:
+            db.session.execute(insert(ExpenseTerm), terms)
+        db.session.commit()
+
+    def search(self, query, category=None, payer_id=None, limit=50):
+        # Newest expenses whose description has every word of `query` (the
+        # last one as a prefix, a range scan of the term index), with facet
+        # counts by category and payer. Each facet ignores its own filter.
+        matches = [Expense.group_id == self.group_id]
+        terms = tokenize(query)
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1:
+                condition = and_(ExpenseTerm.term >= term, ExpenseTerm.term < term + PREFIX_END)
+            else:
+                condition = ExpenseTerm.term == term
+            matches.append(Expense.id.in_(
+                db.select(ExpenseTerm.expense_id).where(ExpenseTerm.group_id == self.group_id, condition)
+            ))
+        category_column = func.coalesce(Expense.category, 'Other')
+        by_category = [category_column == category] if category else []
+        by_payer = [Expense.user_id == payer_id] if payer_id else []
+
+        category_counts = dict(db.session.execute(
+            db.select(category_column, func.count(Expense.id)).where(*matches, *by_payer).group_by(category_column)
+        ).all())
+        payer_counts = dict(db.session.execute(
+            db.select(Expense.user_id, func.count(Expense.id)).where(*matches, *by_category).group_by(Expense.user_id)
+        ).all())
+        total = db.session.scalar(db.select(func.count(Expense.id)).where(*matches, *by_category, *by_payer))
+        rows = db.session.execute(
+            self._expenses().where(*matches, *by_category, *by_payer)
+            .order_by(Expense.date.desc(), Expense.id.desc()).limit(limit)
+        ).all()
+        names = {user['id']: user['name'] for user in self.list_users()}
+        return {
+            'total': total,
+            'expenses': self._with_splits(rows),
+            'facets': facets(category_counts, payer_counts, names)
+        }
+
+    def rebuild_rollups(self):
+        db.session.execute(db.delete(ExpenseRollup).where(ExpenseRollup.group_id == self.group_id))
+        self._roll_totals(self.iter_expenses(), 1)
+        db.session.commit()
+
+    def rebuild_balance_days(self):
+        db.session.execute(db.delete(BalanceDay).where(BalanceDay.group_id == self.group_id))
+        self._roll_balances(self.iter_expenses(), 1)
+        db.session.commit()
+
+    def analytics(self, start=None, end=None):
+        # Totals per category, payer and period. The whole history is read
+        # from the rollup table; a time range is rolled up from an index
+        # range scan of just its expenses.
+        rollups = Rollups()
+        if start or end:
+            query = db.select(Expense.category, Expense.user_id, Expense.amount_cents, Expense.date).where(
+                Expense.group_id == self.group_id
+            )
+            if start:
+                query = query.where(Expense.date >= start)
+            if end:
+                query = query.where(Expense.date < end)
+            for category, payer_id, amount_cents, date in db.session.execute(query):
+                rollups.record({
+                    'category': category,
+                    'payer_id': payer_id,
+                    'amount_cents': amount_cents,
+                    'date': date.strftime('%Y-%m-%d')
+                }, 1)
+        else:
+            rows = db.session.execute(
+                db.select(ExpenseRollup.dimension, ExpenseRollup.bucket, ExpenseRollup.count, ExpenseRollup.total_cents)
+                .where(ExpenseRollup.group_id == self.group_id)
+            )
+            for dimension, bucket, count, total in rows:
+                rollups.table(dimension)[bucket] = {'count': count, 'total_cents': total}
+        names = dict(db.session.execute(db.select(User.id, User.name).where(User.group_id == self.group_id)).all())
+        return {
+            'count': sum(totals['count'] for totals in rollups.by_category.values()),
+            'total_cents': sum(totals['total_cents'] for totals in rollups.by_category.values()),
+            'by_category': rollups.categories(),
+            'by_payer': rollups.payers(names),
+            'by_period': rollups.periods()
+        }
+
+    def _check_members(self, member_ids, payer, splits):
+        # Members may have been removed since the request was validated.
+        # Called after _bump, once no other writer can change them.
+        if payer['id'] not in member_ids or not member_ids.issuperset(splits or {}):
+            db.session.rollback()
+            raise ValueError('The expense refers to someone who is no longer in the group')
+
+    def add_expense(self, payer, amount_cents, description, category, date=None, splits=None):
+        self._bump(expenses=1)
+        member_ids = self._member_ids()
+        self._check_members(set(member_ids), payer, splits)
+        if splits is None:
+            splits = resolve_split(amount_cents, 'equal', member_ids)
+        expense = Expense(
+            id=str(uuid.uuid4()),
+            group_id=self.group_id,
+            user_id=payer['id'],
+            amount_cents=amount_cents,
+            description=description,
+            category=category,
+            date=date or datetime.now()
+        )
+        added = self._insert_expense(expense, payer['name'], splits)
+        db.session.commit()
+        return added
+
+    def _insert_expense(self, expense, payer_name, splits):
+        db.session.add(expense)
+        db.session.flush()
+        db.session.execute(insert(ExpenseShare), self._share_rows(expense.id, splits))
+        terms = self._term_rows(expense.id, expense.description)
+        if terms:
+            db.session.execute(insert(ExpenseTerm), terms)
+        added = self._expense_dict(expense, payer_name, splits)
+        self._roll([added], 1)
+        return added
+
+    def bulk_add_expenses(self, items):
+        # items: iterable of (payer, amount_cents, description, category[, date[, splits]]).
+        # One executemany INSERT per table and one commit for the whole batch.
+        items = list(items)
+        if not items:
+            return []
+        self._bump(expenses=1)
+        member_ids = self._member_ids()
+        members = set(member_ids)
+        added = []
+        rows = []
+        shares = []
+        terms = []
+        for payer, amount_cents, description, category, *rest in items:
+            date = rest[0] if rest else None
+            splits = rest[1] if len(rest) > 1 else None
+            self._check_members(members, payer, splits)
+            if splits is None:
+                splits = resolve_split(amount_cents, 'equal', member_ids)
+            row = {
+                'id': str(uuid.uuid4()),
+                'group_id': self.group_id,
+                'user_id': payer['id'],
+                'amount_cents': amount_cents,
+                'description': description,
+                'category': category,
+                'date': date or datetime.now()
+            }
+            rows.append(row)
+            shares.extend(self._share_rows(row['id'], splits))
+            terms.extend(self._term_rows(row['id'], description))
+            added.append(self._expense_dict(Expense(**row), payer['name'], splits))
+        db.session.execute(insert(Expense), rows)
+        db.session.execute(insert(ExpenseShare), shares)
+        if terms:
+            db.session.execute(insert(ExpenseTerm), terms)
+        self._roll(added, 1)
+        db.session.commit()
+        return added
+
+    def delete_expense(self, expense_id):
+        expense = self.get_expense(expense_id)
+        if expense:
+            self._bump(expenses=1)
+            if not self._remove_expense(expense):
+                # Deleted by another request in the meantime
+                db.session.rollback()
+                return None
+            db.session.commit()
+        return expense
+
+    def _remove_expense(self, expense):
+        db.session.execute(db.delete(ExpenseTerm).where(ExpenseTerm.expense_id == expense['id']))
+        db.session.execute(db.delete(ExpenseShare).where(ExpenseShare.expense_id == expense['id']))
+        deleted = db.session.execute(db.delete(Expense).where(Expense.id == expense['id']))
+        if not deleted.rowcount:
+            return False
+        self._roll([expense], -1)
+        return True
+
+    # Batches
+
+    def apply_batch(self, operations, cache, max_members):
+        # Parsed /api/batch operations (see batch.py) applied in a single
+        # transaction. Bumping the versions first takes the group's row lock,
+        # so the batch runs alone among the group's writers. The members are
+        # kept in a dict as the batch changes them. Each operation runs in a
+        # savepoint, so one that raises leaves nothing half-written behind.
+        self._bump(users=1, expenses=1)
+        users = {user['id']: user for user in self.list_users()}
+
+        def apply(op):
+            with db.session.begin_nested():
+                return self._apply_operation(op, users, max_members)
+
+        results, answered = batch.run(self.group_id, operations, cache, apply)
+        db.session.commit()
+        for key, result in answered.items():
+            cache.put((self.group_id, key), result)
+        return results
+
+    def _apply_operation(self, op, users, max_members):
+        kind = op['op']
+        if kind == 'add_user':
+            if len(users) >= max_members:
+                return batch.failure(409, f'Maximum number of users ({max_members}) reached')
+            if any(user['name'].lower() == op['name'].lower() for user in users.values()):
+                return batch.failure(409, f'User "{op["name"]}" already exists')
+            user = self._insert_user(op['name'])
+            users[user['id']] = user
+            return {'status': 201, 'user': user}
+        if kind == 'remove_user':
+            user = users.get(op['user_id'])
+            if user is None:
+                return batch.failure(404, 'User not found')
+            if self.has_expenses(user['id']):
+                return batch.failure(409, f'Cannot remove {user["name"]} as they are part of recorded expenses')
+            db.session.execute(db.delete(User).where(User.id == user['id']))
+            return {'status': 200, 'user': users.pop(user['id'])}
+        if kind == 'add_expense':
+            # Same member order as _member_ids, for where leftover cents go
+            member_ids = [
+                user['id'] for user in sorted(users.values(), key=lambda user: (not user['is_current'], user['name']))
+            ]
+            try:
+                payer, amount_cents, description, category, _, splits = batch.expense_args(op, users, member_ids)
+            except ValueError as e:
+                return batch.failure(400, str(e))
+            expense = Expense(
+                id=str(uuid.uuid4()), group_id=self.group_id, user_id=payer['id'], amount_cents=amount_cents,
+                description=description, category=category, date=datetime.now()
+            )
+            return {'status': 201, 'expense': self._insert_expense(expense, payer['name'], splits)}
+        expense = self.get_expense(op['expense_id'])
+        if expense is None or not self._remove_expense(expense):
+            return batch.failure(404, 'Expense not found')
+        return {'status': 200, 'expense': expense}
+
+    def clear_expenses(self):
+        db.session.execute(db.delete(ExpenseRollup).where(ExpenseRollup.group_id == self.group_id))
+        db.session.execute(db.delete(BalanceDay).where(BalanceDay.group_id == self.group_id))
+        db.session.execute(db.delete(ExpenseTerm).where(ExpenseTerm.group_id == self.group_id))
+        db.session.execute(db.delete(ExpenseShare).where(ExpenseShare.group_id == self.group_id))
+        db.session.execute(db.delete(Expense).where(Expense.group_id == self.group_id))
+        self._bump(expenses=1)
+        db.session.commit()
+
+    def reset(self):
+        db.session.execute(db.delete(ExpenseRollup).where(ExpenseRollup.group_id == self.group_id))
+        db.session.execute(db.delete(BalanceDay).where(BalanceDay.group_id == self.group_id))
+        db.session.execute(db.delete(ExpenseTerm).where(ExpenseTerm.group_id == self.group_id))
+        db.session.execute(db.delete(ExpenseShare).where(ExpenseShare.group_id == self.group_id))
+        db.session.execute(db.delete(Expense).where(Expense.group_id == self.group_id))
+        db.session.execute(db.delete(User).where(User.group_id == self.group_id))
+        self._bump(users=1, expenses=1)
+        db.session.commit()
+        return self.add_user('You', is_current=True)
+
+    # Balances
+
+    def net_balances(self):
+        return self._net_balances(self._member_ids())
+
+    def balance_snapshot(self, before=None):
+        # Member names together with their net balances. Balances are only
+        # reported for the members that were read, so every one has a name.
+        # With `before` (a datetime), only earlier expenses count.
+        members = db.session.execute(
+            db.select(User.id, User.name).where(User.group_id == self.group_id).order_by(User.is_current.desc(), User.name)
+        ).all()
+        return dict(members), self._net_balances([user_id for user_id, _ in members], before)
+
+    def balance_history(self, moments):
+        # Member names and the net balances before each moment
+        members = db.session.execute(
+            db.select(User.id, User.name).where(User.group_id == self.group_id).order_by(User.is_current.desc(), User.name)
+        ).all()
+        user_ids = [user_id for user_id, _ in members]
+        return dict(members), [self._net_balances(user_ids, moment) for moment in moments]
+
+    def _net_balances(self, user_ids, before=None):
+        if before is None:
+            net = self._expense_net()
+        else:
+            # Whole days from the daily table, then the expenses of the
+            # moment's own day up to it
+            net = dict(db.session.execute(
+                db.select(BalanceDay.user_id, func.sum(BalanceDay.net_cents))
+                .where(BalanceDay.group_id == self.group_id, BalanceDay.day < before.date())
+                .group_by(BalanceDay.user_id)
+            ).all())
+            day_start = datetime.combine(before.date(), datetime.min.time())
+            if before > day_start:
+                for user_id, cents in self._expense_net(day_start, before).items():
+                    net[user_id] = net.get(user_id, 0) + cents
+        return {user_id: net.get(user_id, 0) for user_id in user_ids}
+
+    def _expense_net(self, start=None, end=None):
+        # {user_id: paid - owed} over the expenses with start <= date < end
+        paid_query = (
+            db.select(Expense.user_id, func.sum(Expense.amount_cents))
+            .where(Expense.group_id == self.group_id)
+            .group_by(Expense.user_id)
+        )
+        owed_query = (
+            db.select(ExpenseShare.user_id, func.sum(ExpenseShare.amount_cents))
+            .where(ExpenseShare.group_id == self.group_id)
+            .group_by(ExpenseShare.user_id)
+        )
+        if start is not None or end is not None:
+            owed_query = owed_query.join(Expense, Expense.id == ExpenseShare.expense_id)
+        if start is not None:
+            paid_query = paid_query.where(Expense.date >= start)
+            owed_query = owed_query.where(Expense.date >= start)
+        if end is not None:
+            paid_query = paid_query.where(Expense.date < end)
+            owed_query = owed_query.where(Expense.date < end)
+        net = dict(db.session.execute(paid_query).all())
+        for user_id, cents in db.session.execute(owed_query).all():
+            net[user_id] = net.get(user_id, 0) - cents
+        return net
+
+    def check_consistency(self):
+        # The "ledger" here is the SQL aggregate itself
+        return check_consistency(self, self.list_users(), self.list_expenses())
@@ -0,0 +1,415 @@
+# Columnar storage for one group's expenses.
+#
+# Instead of one dict per expense, every field lives in a column indexed by
+# row number: machine-typed arrays for the amount, payer, category, local
+# day and timestamp, interned strings for descriptions, and the splits
+# flattened into share columns (user, cents) with each row's first share
+# recorded in split_start. Payers, share users and categories are stored
+# as small integer codes into per-table lists. A million expenses take a
+# few dozen bytes of columns each instead of a dict with nine entries and
+# its own splits dict.
+#
+# Balances and analytics over many rows are NumPy reductions straight over
+# the columns (with a plain loop when NumPy is missing), so nothing is built
+# per expense. Code that wants one expense gets an ExpenseRow, a read-only
+# mapping view with the same keys the expense dicts used to have, so
+# templates, the CSV export and the JSON API read it unchanged.
+#
+# Rows are append-only. Deleting marks a row dead; the table is compacted
+# by copying the live rows into a new table, so a view or an export still
+# holding the old table keeps reading consistent data.
+#
+# Each table also keeps a SearchIndex of its descriptions by row (see
+# search_index.py), rebuilt along with it on compaction, clear and reset.
+
+import heapq
+import sys
+import time
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from datetime import date
+
+from search_index import SearchIndex
+from split_engine import np, reduce_columns
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+# Searches matching at most this many rows skip the NumPy column copies
+SEARCH_LOOP_ROWS = 512
+
+# Time ranges holding more than 1/RANGE_SCAN_SHARE of the rows are reduced
+# by masking whole columns rather than looking up each row (see totals)
+RANGE_SCAN_SHARE = 64
+
+
+def _splits(table, row):
+    end = table.split_start[row + 1] if row + 1 < len(table.split_start) else len(table.share_user)
+    start = table.split_start[row]
+    users = table.users
+    return {users[user]: cents for user, cents in zip(table.share_user[start:end], table.share_cents[start:end])}
+
+
+def _view(column):
+    # NumPy view of an array column without copying it. Only the rows picked
+    # out of it may be kept: the column cannot grow while a view exists.
+    return np.frombuffer(column, dtype=getattr(column, 'typecode', 'B'))
+
+
+_FIELDS = {
+    'id': lambda table, row: table.ids[row],
+    'payer_id': lambda table, row: table.users[table.payer[row]],
+    'payer_name': lambda table, row: table.user_names[table.payer[row]],
+    'amount_cents': lambda table, row: table.amount[row],
+    'description': lambda table, row: table.descriptions[row],
+    'category': lambda table, row: table.categories[table.category[row]],
+    'timestamp': lambda table, row: table.timestamp[row],
+    # Formatted on access; time.strftime is about twice as fast as datetime's
+    'date': lambda table, row: time.strftime(DATE_FORMAT, time.localtime(table.timestamp[row])),
+    'splits': _splits,
+}
+
+
+class ExpenseRow(Mapping):
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        return _FIELDS[key](self.table, self.row)
+
+    def __iter__(self):
+        return iter(_FIELDS)
+
+    def __len__(self):
+        return len(_FIELDS)
+
+    def __repr__(self):
+        return f'ExpenseRow({dict(self)!r})'
+
+
+class ExpenseTable:
+    def __init__(self):
+        self.ids = []
+        self.rows = {}
+        self.amount = array('q')
+        self.payer = array('l')
+        self.category = array('l')
+        # Local calendar day as a date ordinal, for the per-period analytics
+        self.day = array('l')
+        self.timestamp = array('d')
+        self.descriptions = []
+        self.split_start = array('q')
+        self.share_user = array('l')
+        self.share_cents = array('q')
+        self.alive = bytearray()
+        self.dead = 0
+        # Codes used by the payer/share_user and category columns
+        self.users = []
+        self.user_names = []
+        self.user_codes = {}
+        self.categories = []
+        self.category_codes = {}
+        self.search_index = SearchIndex()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _user_code(self, user_id, name=None):
+        # Payers come with their name; members seen only in a split get it
+        # when they first pay
+        code = self.user_codes.get(user_id)
+        if code is None:
+            code = self.user_codes[user_id] = len(self.users)
+            self.users.append(user_id)
+            self.user_names.append(name)
+        elif name is not None and self.user_names[code] is None:
+            self.user_names[code] = name
+        return code
+
+    def _category_code(self, category):
+        code = self.category_codes.get(category)
+        if code is None:
+            code = self.category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def append(self, expense_id, payer_id, payer_name, amount_cents, description, category, timestamp, splits):
+        # Every value is checked and converted before any column changes, so
+        # a bad one (an amount past 64 bits, a category that is not a
+        # string) raises without leaving a half-written row behind. A
+        # missing category (None) reads as 'Other'.
+        if not isinstance(description, str) or not isinstance(category, (str, type(None))):
+            raise TypeError('description and category must be strings')
+        amount = array('q', [amount_cents])
+        moment = array('d', [timestamp])
+        day = date.fromtimestamp(timestamp).toordinal()
+        share_cents = array('q', splits.values())
+        share_user = array('l', [self._user_code(user_id) for user_id in splits])
+        payer = self._user_code(payer_id, payer_name)
+        category_code = self._category_code(category)
+        description = sys.intern(description)
+
+        row = len(self.ids)
+        self.ids.append(expense_id)
+        self.rows[expense_id] = row
+        self.amount.extend(amount)
+        self.payer.append(payer)
+        self.category.append(category_code)
+        self.day.append(day)
+        self.timestamp.extend(moment)
+        self.descriptions.append(description)
+        self.search_index.add(row, description)
+        self.split_start.append(len(self.share_user))
+        self.share_user.extend(share_user)
+        self.share_cents.extend(share_cents)
+        self.alive.append(1)
+        return ExpenseRow(self, row)
+
+    def get(self, expense_id):
+        row = self.rows.get(expense_id)
+        return None if row is None else ExpenseRow(self, row)
+
+    def remove(self, expense_id):
+        # Marks the row dead and returns its view, or None
+        row = self.rows.pop(expense_id, None)
+        if row is None:
+            return None
+        self.alive[row] = 0
+        self.dead += 1
+        return ExpenseRow(self, row)
+
+    def __iter__(self):
+        # Live rows in the order they were added
+        for row in self.rows.values():
+            yield ExpenseRow(self, row)
+
+    def needs_compaction(self):
+        return self.dead > 1024 and self.dead > len(self.rows)
+
+    def compacted(self):
+        # A new table with only the live rows
+        table = ExpenseTable()
+        for expense in self:
+            table.append(
+                expense['id'], expense['payer_id'], expense['payer_name'], expense['amount_cents'],
+                expense['description'], expense['category'], expense['timestamp'], expense['splits']
+            )
+        return table
+
+    # Column reductions
+
+    def _mask(self, start=None, end=None):
+        # Live rows with start <= timestamp < end (timestamps in seconds)
+        mask = np.frombuffer(bytes(self.alive), dtype=np.bool_)
+        if start is not None or end is not None:
+            timestamps = _view(self.timestamp)
+            if start is not None:
+                mask = mask & (timestamps >= start)
+            if end is not None:
+                mask = mask & (timestamps < end)
+        return mask
+
+    def net_balances(self, user_ids, start=None, end=None):
+        # {user_id: paid - owed} over the live rows in [start, end)
+        if np is None:
+            return self._net_balances_loop(user_ids, start, end)
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+        # Table user code -> index into user_ids (0 for users no live row uses)
+        remap = np.array([position.get(user_id, 0) for user_id in self.users] or [0], dtype=np.intp)
+        mask = self._mask(start, end)
+        starts = np.array(self.split_start, dtype=np.int64)
+        counts = np.diff(np.append(starts, len(self.share_user)))
+        share_mask = np.repeat(mask, counts)
+        net = reduce_columns(
+            len(user_ids),
+            remap[np.array(self.payer, dtype=np.intp)[mask]],
+            np.array(self.amount, dtype=np.int64)[mask],
+            remap[np.array(self.share_user, dtype=np.intp)[share_mask]],
+            np.array(self.share_cents, dtype=np.int64)[share_mask]
+        )
+        return dict(zip(user_ids, net.tolist()))
+
+    def _net_balances_loop(self, user_ids, start, end):
+        net = dict.fromkeys(user_ids, 0)
+        for expense in self:
+            timestamp = expense['timestamp']
+            if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+                continue
+            net[expense['payer_id']] += expense['amount_cents']
+            for user_id, cents in expense['splits'].items():
+                net[user_id] -= cents
+        return net
+
+    def net_by_chunks(self, rows, size):
+        # [{user_id: paid - owed}, ...] over each run of `size` rows, taken in
+        # the order given (users whose net is 0 are left out)
+        if np is None or len(rows) <= SEARCH_LOOP_ROWS:
+            return self._net_by_chunks_loop(rows, size)
+        rows = np.asarray(rows, dtype=np.int64)
+        chunk = np.arange(len(rows)) // size
+        users = len(self.users)
+        cells = (int(chunk[-1]) + 1) * users
+        split_start = _view(self.split_start)
+        starts = split_start[rows]
+        after = rows + 1
+        last = after == len(split_start)
+        ends = split_start[np.where(last, 0, after)]
+        ends[last] = len(self.share_user)
+        counts = ends - starts
+        # Position of every share of every row, in row order
+        shares = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+        paid = np.bincount(
+            chunk * users + _view(self.payer)[rows], weights=_view(self.amount)[rows], minlength=cells
+        )
+        owed = np.bincount(
+            np.repeat(chunk, counts) * users + _view(self.share_user)[shares],
+            weights=_view(self.share_cents)[shares], minlength=cells
+        )
+        # float64 sums of whole cents are exact up to 2**53
+        net = np.rint(paid - owed).astype(np.int64).reshape(-1, users).tolist()
+        user_ids = self.users
+        return [{user_ids[code]: cents for code, cents in enumerate(totals) if cents} for totals in net]
+
+    def _net_by_chunks_loop(self, rows, size):
+        result = []
+        for n, row in enumerate(rows):
+            if n % size == 0:
+                net = {}
+                result.append(net)
+            payer = self.users[self.payer[row]]
+            net[payer] = net.get(payer, 0) + self.amount[row]
+            for user_id, cents in _splits(self, row).items():
+                net[user_id] = net.get(user_id, 0) - cents
+        return [{user_id: cents for user_id, cents in net.items() if cents} for net in result]
+
+    def totals(self, keys, start=None, end=None):
+        # (count, total_cents) per category, payer id and 'YYYY-MM-DD' day
+        # over the store's timeline slice `keys` ((timestamp, id) pairs of
+        # the live rows in [start, end)). A narrow range looks up just its
+        # own rows; once it holds more than 1/RANGE_SCAN_SHARE of the table,
+        # masking the whole timestamp column is cheaper than the lookups.
+        if np is None or len(keys) <= SEARCH_LOOP_ROWS:
+            return self._totals_loop([self.rows[expense_id] for _, expense_id in keys])
+        if len(keys) * RANGE_SCAN_SHARE > len(self.rows):
+            rows = np.flatnonzero(self._mask(start, end))
+        else:
+            ids = self.rows
+            rows = np.array([ids[expense_id] for _, expense_id in keys], dtype=np.int64)
+        amounts = _view(self.amount)[rows]
+        result = []
+        for column, label in (
+            (self.category, self.categories.__getitem__),
+            (self.payer, self.users.__getitem__),
+            (self.day, lambda ordinal: date.fromordinal(ordinal).isoformat()),
+        ):
+            # Codes are small and dense (days once shifted by the first one)
+            codes = _view(column)[rows]
+            first = int(codes.min())
+            codes = codes - first
+            counts = np.bincount(codes)
+            # float64 sums of whole cents are exact up to 2**53
+            sums = np.rint(np.bincount(codes, weights=amounts)).astype(np.int64)
+            result.append({
+                label(code + first): (count, total)
+                for code, (count, total) in enumerate(zip(counts.tolist(), sums.tolist())) if count
+            })
+        return tuple(result)
+
+    def _totals_loop(self, rows):
+        tables = ({}, {}, {})
+        for row in rows:
+            keys = (
+                self.categories[self.category[row]],
+                self.users[self.payer[row]],
+                date.fromordinal(self.day[row]).isoformat()
+            )
+            for table, key in zip(tables, keys):
+                count, total = table.get(key, (0, 0))
+                table[key] = (count + 1, total + self.amount[row])
+        return tables
+
+    # Search
+
+    def search(self, terms, category=None, payer_id=None, limit=50):
+        # Returns (matches, newest `limit` of them, {category: count},
+        # {payer_id: count}) over the live rows containing the terms, or all
+        # live rows without terms. The category facet ignores the category
+        # filter and the payer facet the payer filter, so each shows what
+        # picking another value would give.
+        if terms:
+            rows = self.search_index.match(terms)
+        elif np is not None:
+            rows = np.arange(len(self.ids))
+        else:
+            rows = self.rows.values()
+        category_codes = None
+        if category is not None:
+            category_codes = [code for code, name in enumerate(self.categories) if (name or 'Other') == category]
+        payer_code = self.user_codes.get(payer_id, -1) if payer_id is not None else None
+
+        # A few hundred rows are quicker to walk than to copy columns for
+        if np is not None and len(rows) > SEARCH_LOOP_ROWS:
+            hits, category_counts, payer_counts = self._search_arrays(rows, category_codes, payer_code)
+            timestamps = _view(self.timestamp)[hits]
+            if len(hits) > limit:
+                top = np.argpartition(-timestamps, limit)[:limit]
+            else:
+                top = np.arange(len(hits))
+            newest = hits[top[np.argsort(-timestamps[top], kind='stable')]].tolist()
+            total = len(hits)
+        else:
+            if np is not None:
+                rows = rows.tolist()
+            hits, category_counts, payer_counts = self._search_loop(rows, category_codes, payer_code)
+            newest = heapq.nlargest(limit, hits, key=self.timestamp.__getitem__)
+            total = len(hits)
+
+        by_category = Counter()
+        for code, count in category_counts.items():
+            by_category[self.categories[code] or 'Other'] += count
+        by_payer = {self.users[payer]: count for payer, count in payer_counts.items()}
+        return total, [ExpenseRow(self, row) for row in newest], by_category, by_payer
+
+    def _search_arrays(self, rows, category_codes, payer_code):
+        rows = rows[_view(self.alive)[rows].astype(np.bool_)]
+        categories = _view(self.category)[rows]
+        payers = _view(self.payer)[rows]
+        category_ok = np.isin(categories, category_codes) if category_codes is not None else None
+        payer_ok = payers == payer_code if payer_code is not None else None
+        category_counts = np.bincount(
+            categories if payer_ok is None else categories[payer_ok], minlength=len(self.categories)
+        )
+        payer_counts = np.bincount(payers if category_ok is None else payers[category_ok], minlength=len(self.users))
+        if category_ok is not None and payer_ok is not None:
+            rows = rows[category_ok & payer_ok]
+        elif category_ok is not None or payer_ok is not None:
+            rows = rows[payer_ok if category_ok is None else category_ok]
+        return (
+            rows,
+            {code: count for code, count in enumerate(category_counts.tolist()) if count},
+            {code: count for code, count in enumerate(payer_counts.tolist()) if count}
+        )
+
+    def _search_loop(self, rows, category_codes, payer_code):
+        alive = self.alive
+        categories, payers = self.category, self.payer
+        category_counts = Counter()
+        payer_counts = Counter()
+        hits = []
+        for row in rows:
+            if not alive[row]:
+                continue
+            code = categories[row]
+            payer = payers[row]
+            category_ok = category_codes is None or code in category_codes
+            payer_ok = payer_code is None or payer == payer_code
+            if payer_ok:
+                category_counts[code] += 1
+            if category_ok:
+                payer_counts[payer] += 1
+                if payer_ok:
+                    hits.append(row)
+        return hits, category_counts, payer_counts
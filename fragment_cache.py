@@ -0,0 +1,44 @@
+# Cache for rendered page fragments.
+#
+# Each fragment is stored with the key it was rendered for (typically the
+# store's data version counters) and re-rendered only when that key changes.
+# With many groups the cache is bounded, dropping the least recently used
+# fragments first.
+#
+# The lock only guards the bookkeeping; rendering happens outside it, so two
+# threads may occasionally render the same fragment and the last one wins.
+
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+
+class FragmentCache:
+    def __init__(self, max_entries=1000):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, key, render):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        html = Markup(render())
+        with self._lock:
+            self._entries[name] = (key, html)
+            self._entries.move_to_end(name)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
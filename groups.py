@@ -0,0 +1,100 @@
+# Registry of independent groups (households, trips, ...).
+#
+# Each group is its own InMemoryStore with its own members, expenses,
+# ledger and version counters, so nothing done in one group ever scans or
+# touches another. The registry itself is only a dict lookup by id; the
+# lock just keeps concurrent group creation from interleaving.
+#
+# Given a WriteAheadLog, the registry restores every group from the latest
+# snapshot plus the log on startup, attaches the log to each store, and
+# takes a new snapshot in the background whenever the log has grown enough.
+
+import threading
+import uuid
+
+from store import InMemoryStore
+
+
+class GroupRegistry:
+    def __init__(self, log=None):
+        self.groups = {}
+        self.lock = threading.Lock()
+        self.log = log
+        self.snapshot_lock = threading.Lock()
+        if log is not None:
+            self._restore()
+            threading.Thread(target=self._snapshot_loop, name='wal-snapshot', daemon=True).start()
+
+    def list_groups(self):
+        with self.lock:
+            stores = list(self.groups.values())
+        return [{'id': store.group_id, 'name': store.group_name} for store in stores]
+
+    def create_group(self, name):
+        store = InMemoryStore(str(uuid.uuid4()), name)
+        store.log = self.log
+        with self.lock:
+            if self.log is not None:
+                self.log.append({'op': 'create_group', 'group': store.group_id, 'name': name})
+            self.groups[store.group_id] = store
+        if self.log is not None:
+            self.log.sync()
+        return store
+
+    def get(self, group_id):
+        return self.groups.get(group_id)
+
+    def default(self):
+        # The oldest group
+        with self.lock:
+            return next(iter(self.groups.values()), None)
+
+    def sizes(self):
+        # Totals for monitoring, read without taking the group locks
+        with self.lock:
+            stores = list(self.groups.values())
+        return {
+            'groups': len(stores),
+            'users': sum(store.user_count() for store in stores),
+            'expenses': sum(store.expense_count() for store in stores)
+        }
+
+    # Durability
+
+    def _restore(self):
+        snapshot = self.log.read_snapshot() or {'groups': []}
+        for dump in snapshot['groups']:
+            store = InMemoryStore(dump['id'], dump['name'])
+            store.load(dump)
+            self.groups[store.group_id] = store
+
+        # Records already covered by a group's part of the snapshot are skipped
+        for record in self.log.records():
+            store = self.groups.get(record['group'])
+            if record['op'] == 'create_group':
+                if store is None:
+                    self.groups[record['group']] = InMemoryStore(record['group'], record['name'])
+            elif record['seq'] > store.log_seq:
+                store.apply(record)
+
+        for store in self.groups.values():
+            store.log = self.log
+        self.log.start()
+
+    def snapshot(self):
+        # Dump every group and drop the log segments the dump covers
+        with self.snapshot_lock:
+            old_segments, seq = self.log.rotate()
+            with self.lock:
+                stores = list(self.groups.values())
+            self.log.write_snapshot({'seq': seq, 'groups': [store.dump() for store in stores]})
+            self.log.remove_segments(old_segments)
+
+    def _snapshot_loop(self):
+        while self.log.wait_until_full():
+            self.snapshot()
+
+    def close(self):
+        if self.log is not None:
+            self.snapshot()
+            self.log.close()
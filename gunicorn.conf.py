@@ -0,0 +1,84 @@
+# Production server settings.
+#
+#     gunicorn -c gunicorn.conf.py
+#
+# `python main.py` is the development server (debugger only with
+# FLASK_DEBUG=1); this is what serves real traffic. Everything can be
+# tuned from the environment:
+#
+#   PORT / BIND          where to listen (0.0.0.0:$PORT, default port 8000)
+#   WEB_CONCURRENCY      worker processes. The in-memory backend keeps each
+#                        group's data (and its write-ahead log) in the
+#                        process that owns it, so it always runs one worker;
+#                        with STORAGE_BACKEND=sql the default is 2 x CPUs + 1.
+#   WORKER_CLASS         'gevent' (the default when gevent is installed) or
+#                        'gthread'. Install gevent for production: see below.
+#   WORKER_CONNECTIONS   concurrent requests per gevent worker (1000)
+#   THREADS              request threads per gthread worker (16)
+#   TIMEOUT, GRACEFUL_TIMEOUT, KEEPALIVE   seconds, see gunicorn's docs
+#
+# The long-lived responses are /events (live updates, open for as long as
+# the page is) and /export/csv (a large history streams for seconds, longer
+# to a slow client). Under gevent each open response is a greenlet parked
+# on its socket or on the broadcaster's condition, so hundreds of them cost
+# a little memory each and no worker sits blocked on a slow client. With
+# gthread every open response holds one of the worker's THREADS for its
+# whole life: one /events stream per open tab would use them all up (and
+# the in-memory backend has a single worker), so under gthread live
+# updates are turned off (LIVE_UPDATES=0) and pages fall back to plain
+# form posts and reloads. Exports still hold a thread while they stream.
+#
+# Live updates are published within a process: with several SQL workers a
+# page only hears about changes made through the worker its /events stream
+# is connected to (others show up on the next reload). The sampling
+# profiler sees OS threads, so under gevent it only shows the busy worker
+# thread as a whole.
+
+import multiprocessing
+import os
+
+try:
+    import gevent  # noqa: F401
+except ImportError:
+    gevent = None
+
+wsgi_app = 'main:app'
+
+bind = os.environ.get('BIND', f'0.0.0.0:{os.environ.get("PORT", "8000")}')
+
+if os.environ.get('STORAGE_BACKEND', 'memory') == 'sql':
+    workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+else:
+    workers = 1
+
+worker_class = os.environ.get('WORKER_CLASS', 'gevent' if gevent is not None else 'gthread')
+if worker_class != 'gevent':
+    # Read by the app when the workers import it
+    os.environ['LIVE_UPDATES'] = '0'
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '1000'))
+threads = int(os.environ.get('THREADS', '16'))
+
+# Streams are not requests in progress as far as the timeout goes: the
+# gevent and gthread workers heartbeat from their own loop
+timeout = int(os.environ.get('TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('KEEPALIVE', '5'))
+
+# The app must be imported after gevent has patched the worker, and each
+# worker opens its own database connections
+preload_app = False
+
+accesslog = os.environ.get('ACCESS_LOG')
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+
+def when_ready(server):
+    if worker_class != 'gevent':
+        server.log.error(
+            'Running %s workers%s: live updates are off, since every open page would hold a thread. '
+            'Use gevent workers (pip install gevent) to serve them.',
+            worker_class, '' if gevent is not None else ' because gevent is not installed'
+        )
+    if os.environ.get('STORAGE_BACKEND', 'memory') != 'sql' and os.environ.get('WEB_CONCURRENCY', '1') != '1':
+        server.log.warning('The in-memory backend runs a single worker; WEB_CONCURRENCY is ignored')
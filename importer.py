@@ -0,0 +1,124 @@
+# Bulk expense import.
+#
+# Accepts either the CSV layout written by export_csv (Date, Paid By,
+# Description, Category, Amount) or JSON lines with the same fields in
+# lowercase (date, paid_by / payer_id, description, category, amount).
+# Rows are read lazily from the upload and validated a batch at a time.
+# Bytes that are not UTF-8 fail their JSON line; in a CSV they end the
+# import at that point, since the rest of the file cannot be split into rows.
+
+import csv
+import json
+from datetime import datetime
+
+from money import parse_cents
+
+CSV_FIELDS = {
+    'Date': 'date',
+    'Paid By': 'paid_by',
+    'Description': 'description',
+    'Category': 'category',
+    'Amount': 'amount',
+}
+DATE_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+
+def _decoded(stream):
+    # The upload's lines as text, decoded one at a time so that bad bytes
+    # are found at the line they are on
+    for number, line in enumerate(stream, start=1):
+        yield line.decode('utf-8-sig' if number == 1 else 'utf-8')
+
+
+def iter_rows(stream, fmt):
+    # Yields (row_number, row_dict) from a binary upload stream. Rows that
+    # cannot be read come as {'_invalid': reason}.
+    if fmt == 'csv':
+        number = 0
+        try:
+            for number, row in enumerate(csv.DictReader(_decoded(stream)), start=1):
+                yield number, {CSV_FIELDS.get(key, key): value for key, value in row.items()}
+        except UnicodeDecodeError:
+            yield number + 1, {'_invalid': 'File is not valid UTF-8 from this row on'}
+    else:
+        for number, line in enumerate(stream, start=1):
+            try:
+                line = line.decode('utf-8-sig' if number == 1 else 'utf-8').strip()
+            except UnicodeDecodeError:
+                yield number, {'_invalid': 'Row is not valid UTF-8'}
+                continue
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else {'_invalid': 'Row is not a JSON object'}
+
+
+def iter_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_date(value):
+    if not value:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'Unrecognised date "{value}"')
+
+
+def validate_batch(batch, users_by_id, users_by_name):
+    # Returns (items ready for store.bulk_add_expenses, per-row errors).
+    # Payers are resolved through prebuilt maps, one dict hit per row.
+    items = []
+    errors = []
+    for number, row in batch:
+        if row.get('_invalid'):
+            errors.append({'row': number, 'error': row['_invalid']})
+            continue
+
+        payer_id = row.get('payer_id')
+        paid_by = row.get('paid_by') or ''
+        if not isinstance(payer_id, (str, type(None))) or not isinstance(paid_by, str):
+            errors.append({'row': number, 'error': 'payer_id and paid_by must be strings'})
+            continue
+        payer = users_by_id.get(payer_id) if payer_id else None
+        if payer is None:
+            payer = users_by_name.get(paid_by.strip().lower())
+        if payer is None:
+            errors.append({'row': number, 'error': 'Payer not found'})
+            continue
+
+        try:
+            amount_cents = parse_cents(row.get('amount'))
+            if amount_cents <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append({'row': number, 'error': 'Amount must be a positive number'})
+            continue
+
+        description = str(row.get('description') or '').strip()
+        if not description:
+            errors.append({'row': number, 'error': 'Description is required'})
+            continue
+
+        try:
+            date = parse_date(row.get('date'))
+        except ValueError as e:
+            errors.append({'row': number, 'error': str(e)})
+            continue
+
+        category = str(row.get('category') or '').strip() or 'Other'
+        items.append((payer, amount_cents, description, category, date))
+    return items, errors
@@ -0,0 +1,65 @@
+# Running per-user balance ledger.
+#
+# Each expense records who paid and how the amount is split between its
+# participants (in integer cents), so a user's net balance is simply what
+# they paid minus the shares they owe. Keeping both sums up to date on each
+# mutation means reading the balances costs O(users) instead of a pass over
+# the whole history.
+
+from split_engine import compute_net_balances
+
+
+class BalanceLedger:
+    def __init__(self):
+        self.paid = {}
+        self.owed = {}
+
+    def add_user(self, user_id):
+        self.paid.setdefault(user_id, 0)
+        self.owed.setdefault(user_id, 0)
+
+    def remove_user(self, user_id):
+        # Users can only be removed once they take no part in any expense
+        self.paid.pop(user_id, None)
+        self.owed.pop(user_id, None)
+
+    def record_expense(self, payer_id, amount_cents, splits):
+        self.paid[payer_id] = self.paid.get(payer_id, 0) + amount_cents
+        for user_id, cents in splits.items():
+            self.owed[user_id] = self.owed.get(user_id, 0) + cents
+
+    def remove_expense(self, payer_id, amount_cents, splits):
+        self.paid[payer_id] = self.paid.get(payer_id, 0) - amount_cents
+        for user_id, cents in splits.items():
+            self.owed[user_id] = self.owed.get(user_id, 0) - cents
+
+    def clear_expenses(self):
+        self.reset(self.paid)
+
+    def reset(self, user_ids):
+        self.paid = {user_id: 0 for user_id in user_ids}
+        self.owed = dict.fromkeys(self.paid, 0)
+
+    def net_balances(self):
+        return {user_id: paid - self.owed.get(user_id, 0) for user_id, paid in self.paid.items()}
+
+
+def recompute_net_balances(users, expenses):
+    # Full recompute from the expense history, kept as the reference the
+    # ledger is checked against
+    return compute_net_balances([user['id'] for user in users], expenses)
+
+
+def check_consistency(ledger, users, expenses):
+    # Returns the users whose ledger balance differs from a full recompute
+    return find_mismatches(recompute_net_balances(users, expenses), ledger.net_balances())
+
+
+def find_mismatches(expected, actual):
+    mismatches = []
+    for user_id in expected.keys() | actual.keys():
+        want = expected.get(user_id)
+        got = actual.get(user_id)
+        if want != got:
+            mismatches.append({'user_id': user_id, 'expected': want, 'actual': got})
+    return mismatches
@@ -1,43 +1,86 @@
+import atexit
+import hashlib
 import os
-import uuid
-import csv
-import io
-from flask import Flask, render_template_string, request, redirect, url_for, flash, jsonify, session, Response
+import threading
+import time
+from collections.abc import Mapping
+from flask import Flask, g, render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context, abort, before_render_template, template_rendered
+from flask.json.provider import DefaultJSONProvider
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+import batch
+from broadcaster import Broadcaster
+from assets import StaticAssets
+import compression
+from export import cooperative, iter_csv, gzip_chunks
+from fragment_cache import FragmentCache
+import importer
+from money import format_cents, parse_cents
+from settlement import settle
+from split_engine import resolve_split
+from groups import GroupRegistry
+from rollups import PERIODS, period_keys, next_period_start
+from metrics import Metrics
+from profiler import SamplingProfiler
+from wal import WriteAheadLog
+
+# Setup logging; DEBUG logs every request detail and is slow under load
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+
+class JSONProvider(DefaultJSONProvider):
+    # The in-memory store hands out expenses as read-only mapping views
+    @staticmethod
+    def default(o):
+        if isinstance(o, Mapping):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+# static/ is served by serve_static below, from fingerprinted copies
+app = Flask(__name__, static_folder=None)
+app.json = JSONProvider(app)
+app.secret_key = os.environ.get("SESSION_SECRET", "splitstack-secret-key")
+# 'greedy' (fast) or 'minimal' (fewest transfers)
+app.config['SETTLEMENT_MODE'] = os.environ.get("SETTLEMENT_MODE", "greedy")
+
+# 'memory' (default) or 'sql' (SQLAlchemy, SQLite unless DATABASE_URL is set)
+app.config['STORAGE_BACKEND'] = os.environ.get("STORAGE_BACKEND", "memory")
+
+if app.config['STORAGE_BACKEND'] == 'sql':
+    from db_store import SQLGroupRegistry
+    from models import db
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL", "sqlite:///splitstack.db")
+    db.init_app(app)
+    groups = SQLGroupRegistry(app)
+else:
+    # In-memory data storage, one store per group. With DATA_DIR set every
+    # change is also written to a write-ahead log there and survives restarts.
+    app.config['DATA_DIR'] = os.environ.get("DATA_DIR")
+    if app.config['DATA_DIR']:
+        log = WriteAheadLog(app.config['DATA_DIR'], int(os.environ.get("SNAPSHOT_EVERY", "50000")))
+        groups = GroupRegistry(log)
+        atexit.register(groups.close)
+    else:
+        groups = GroupRegistry()
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
+# Members allowed in a single group. Balances are computed per group, so
+# this no longer depends on how much data the whole deployment holds.
+app.config['MAX_GROUP_MEMBERS'] = int(os.environ.get("MAX_GROUP_MEMBERS", "100"))
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "splitstack-secret-key")
+# Gzip/brotli pages, JSON and CSV here; turn off when a proxy in front
+# already compresses responses
+app.config['COMPRESS_RESPONSES'] = os.environ.get("COMPRESS_RESPONSES", "1") == "1"
 
-# In-memory data storage
-users = []
-expenses = []
+assets = StaticAssets(os.path.join(app.root_path, 'static'))
 
-# Add a default user and friends
-default_user = {
-    'id': str(uuid.uuid4()),
-    'name': 'You',
-    'is_current': True
-}
-users.append(default_user)
+# Rows validated and written per batch by /expenses/import
+IMPORT_BATCH_SIZE = 1000
 
-# Add some friends
-friend1 = {
-    'id': str(uuid.uuid4()),
-    'name': 'Alex',
-    'is_current': False
-}
-users.append(friend1)
+# Operations accepted by one /api/batch request
+BATCH_SIZE_LIMIT = 1000
 
-friend2 = {
-    'id': str(uuid.uuid4()),
-    'name': 'Sam',
-    'is_current': False
-}
-users.append(friend2)
+# Rows shown per category before "Show more"
+EXPENSE_PAGE_SIZE = 50
 
 # Define expense categories
 expense_categories = [
@@ -45,602 +88,791 @@ expense_categories = [
     "Shopping", "Health", "Education", "Travel", "Other"
 ]
 
-# Add some sample expenses with more diverse categories
-expenses.append({
-    'id': str(uuid.uuid4()),
-    'payer_id': friend1['id'],
-    'payer_name': friend1['name'],
-    'amount': 45.75,
-    'description': 'Dinner at restaurant',
-    'category': 'Food',
-    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-})
-
-expenses.append({
-    'id': str(uuid.uuid4()),
-    'payer_id': default_user['id'],
-    'payer_name': default_user['name'],
-    'amount': 30.50,
-    'description': 'Groceries',
-    'category': 'Food',
-    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-})
-
-expenses.append({
-    'id': str(uuid.uuid4()),
-    'payer_id': friend2['id'],
-    'payer_name': friend2['name'],
-    'amount': 22.99,
-    'description': 'Movie tickets',
-    'category': 'Entertainment',
-    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-})
-
-expenses.append({
-    'id': str(uuid.uuid4()),
-    'payer_id': friend1['id'],
-    'payer_name': friend1['name'],
-    'amount': 800.00,
-    'description': 'Apartment rent',
-    'category': 'Rent',
-    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-})
-
-expenses.append({
-    'id': str(uuid.uuid4()),
-    'payer_id': default_user['id'],
-    'payer_name': default_user['name'],
-    'amount': 35.50,
-    'description': 'Uber ride',
-    'category': 'Transportation',
-    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-})
-
-expenses.append({
-    'id': str(uuid.uuid4()),
-    'payer_id': friend2['id'],
-    'payer_name': friend2['name'],
-    'amount': 95.20,
-    'description': 'Electricity bill',
-    'category': 'Utilities',
-    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-})
-
-expenses.append({
-    'id': str(uuid.uuid4()),
-    'payer_id': friend1['id'],
-    'payer_name': friend1['name'],
-    'amount': 65.75,
-    'description': 'New clothes',
-    'category': 'Shopping',
-    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-})
-
-expenses.append({
-    'id': str(uuid.uuid4()),
-    'payer_id': default_user['id'],
-    'payer_name': default_user['name'],
-    'amount': 40.00,
-    'description': 'Pharmacy',
-    'category': 'Health',
-    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-})
-
-# HTML template for the application
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en" data-bs-theme="light" id="html-root">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <link rel="manifest" href="/static/manifest.json">
-    <meta name="theme-color" content="#212529">
-    <meta name="description" content="SplitStack - Split expenses with friends easily">
-    <meta name="theme-color" content="#212529">
-    <title>SplitStack - Expense Sharing</title>
-    <link href="https://cdn.replit.com/agent/bootstrap-agent-dark-theme.min.css" rel="stylesheet">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">
-    <link rel="stylesheet" href="{{ url_for('static', filename='css/styles.css') }}">
-    <link rel="manifest" href="{{ url_for('static', filename='manifest.json') }}">
-    <link rel="icon" type="image/png" href="{{ url_for('static', filename='icons/icon-192x192.png') }}">
-    <link rel="apple-touch-icon" href="{{ url_for('static', filename='icons/icon-192x192.png') }}">
-</head>
-<body>
-    <nav class="navbar navbar-expand-lg navbar-dark bg-dark">
-        <div class="container">
-            <a class="navbar-brand" href="/">
-                <i class="fas fa-receipt me-2"></i>SplitStack
-            </a>
-            <div class="d-flex align-items-center">
-                <div class="form-check form-switch me-3">
-                    <input class="form-check-input" type="checkbox" id="darkModeToggle" checked>
-                    <label class="form-check-label text-light" for="darkModeToggle">
-                        <i class="fas fa-moon"></i>
-                    </label>
-                </div>
-                <div class="navbar-text text-light">
-                    <i class="fas fa-user-circle me-1"></i> Logged in
-                </div>
-            </div>
-        </div>
-    </nav>
-
-    <div class="container mt-4">
-        {% with messages = get_flashed_messages(with_categories=true) %}
-            {% if messages %}
-                {% for category, message in messages %}
-                    <div class="alert alert-{{ category }} alert-dismissible fade show" role="alert">
-                        {{ message }}
-                        <button type="button" class="btn-close" data-bs-dismiss="alert" aria-label="Close"></button>
-                    </div>
-                {% endfor %}
-            {% endif %}
-        {% endwith %}
-
-        <div class="row">
-            <div class="col-md-4">
-                <div class="card mb-4">
-                    <div class="card-header">
-                        <h5 class="mb-0"><i class="fas fa-users me-2"></i>Users</h5>
-                    </div>
-                    <div class="card-body">
-                        <form id="addUserForm" action="/users/add" method="post" class="mb-3">
-                            <div class="input-group">
-                                <input type="text" class="form-control" name="name" placeholder="User name" required>
-                                <button type="submit" class="btn btn-primary">Add</button>
-                            </div>
-                        </form>
-
-                        <ul class="list-group" id="usersList">
-                            {% if users %}
-                                {% for user in users %}
-                                    <li class="list-group-item d-flex justify-content-between align-items-center {% if user.is_current %}bg-primary bg-opacity-25{% endif %}">
-                                        {{ user.name }} {% if user.is_current %}<span class="badge bg-primary ms-2">You</span>{% endif %}
-                                        <form action="/users/remove" method="post" class="d-inline">
-                                            <input type="hidden" name="user_id" value="{{ user.id }}">
-                                            <button type="submit" class="btn btn-sm btn-danger" {% if user.is_current %}disabled{% endif %}>
-                                                <i class="fas fa-trash"></i>
-                                            </button>
-                                        </form>
-                                    </li>
-                                {% endfor %}
-                            {% else %}
-                                <li class="list-group-item text-center text-muted">No users added yet</li>
-                            {% endif %}
-                        </ul>
-                    </div>
-                </div>
-            </div>
-
-            <div class="col-md-8">
-                <div class="card mb-4">
-                    <div class="card-header">
-                        <h5 class="mb-0"><i class="fas fa-file-invoice-dollar me-2"></i>Add Expense</h5>
-                    </div>
-                    <div class="card-body">
-                        {% if users|length < 2 %}
-                            <div class="alert alert-info">
-                                Add at least 2 users to start tracking expenses
-                            </div>
-                        {% else %}
-                             <form action="/expenses/add" method="post">
-                                <div class="mb-3">
-                                    <label for="payer" class="form-label">Who paid?</label>
-                                    <select class="form-select" id="payer" name="payer_id" required>
-                                        <option value="" selected disabled>Select a user</option>
-                                        {% for user in users %}
-                                            <option value="{{ user.id }}" {% if user.is_current %}selected{% endif %}>{{ user.name }} {% if user.is_current %}(You){% endif %}</option>
-                                        {% endfor %}
-                                    </select>
-                                </div>
-
-                                <div class="mb-3">
-                                    <label for="amount" class="form-label">Amount</label>
-                                    <div class="input-group">
-                                        <span class="input-group-text">$</span>
-                                        <input type="number" class="form-control" id="amount" name="amount" 
-                                               min="0.01" step="0.01" placeholder="0.00" required>
-                                    </div>
-                                </div>
-                                      <label for="description" class="form-label">Description</label>
-                                      <input type="text" class="form-control" id="description" name="description" placeholder="What was this for?" required>
-                                    </div>
-
-                                    <div class="mb-3">
-                                      <label for="category" class="form-label">Category</label>
-                                      <select class="form-select" id="category" name="category" required>
-                                        <option value="" selected disabled>Select category</option>
-                                        {% for category in expense_categories %}
-                                        <option value="{{ category }}">{{ category }}</option>
-                                        {% endfor %}
-                                      </select>
-                                    </div>
-
-                                <div class="d-grid">
-                                    <button type="submit" class="btn btn-primary">Add Expense</button>
-                                </div>
-                            </form>
-                        {% endif %}
-                    </div>
-                </div>
-
-                <div class="card mb-4">
-                    <div class="card-header d-flex justify-content-between align-items-center">
-                        <h5 class="mb-0 fs-4">
-                            <i class="fas fa-list-alt me-2"></i>Expenses
-                        </h5>
-                        <div class="btn-group">
-                            {% if expenses %}
-                                <a href="{{ url_for('export_csv') }}" class="btn btn-sm btn-success">
-                                    <i class="fas fa-file-csv me-1"></i> Export CSV
-                                </a>
-                                <form action="/expenses/clear" method="post" class="d-inline">
-                                    <button type="submit" class="btn btn-sm btn-danger">
-                                        <i class="fas fa-trash me-1"></i> Clear All
-                                    </button>
-                                </form>
-                            {% endif %}
-                        </div>
-                    </div>
-                    {% if expenses %}
-                    <div class="card-body bg-light bg-opacity-10 p-3">
-                        <div class="d-flex justify-content-between align-items-center">
-                            <div>
-                                <h4 class="mb-0 fs-5">Total Spent</h4>
-                                <div class="fs-3 fw-bold text-primary">${{ "%.2f"|format(expenses|sum(attribute='amount')) }}</div>
-                            </div>
-                            <div class="text-end">
-                                <p class="mb-0 text-muted">Total expenses</p>
-                                <span class="badge bg-secondary fs-6 p-2">
-                                    {{ expenses|length }} expense{% if expenses|length != 1 %}s{% endif %}
-                                </span>
-                            </div>
-                        </div>
-                    </div>
-                    {% endif %}
-                    <div class="card-body p-0">
-                        <div class="table-responsive">
-                            <table class="table table-hover mb-0">
-                                <thead>
-                                    <tr>
-                                        <th>Paid by</th>
-                                        <th>Description</th>
-                                        <th>Category</th>
-                                        <th>Amount</th>
-                                        <th>Date</th>
-                                    </tr>
-                                </thead>
-                                <tbody>
-                                    {% if expenses %}
-                                        {# Group expenses by category #}
-                                        {% set categories = {} %}
-                                        {% for expense in expenses %}
-                                            {% set cat = expense.category|default('Other') %}
-                                            {% if cat not in categories %}
-                                                {% set _ = categories.update({cat: []}) %}
-                                            {% endif %}
-                                            {% set _ = categories[cat].append(expense) %}
-                                        {% endfor %}
-
-                                        {% for category, cat_expenses in categories.items() %}
-                                            <tr class="table-group-divider category-header">
-                                                <td colspan="5" class="category-title bg-opacity-10 p-3 {% if category == 'Food' %}bg-success{% elif category == 'Entertainment' %}bg-info{% elif category == 'Transportation' %}bg-warning{% elif category == 'Shopping' %}bg-danger{% elif category == 'Travel' %}bg-primary{% elif category == 'Utilities' %}bg-info{% elif category == 'Rent' %}bg-dark{% elif category == 'Health' %}bg-danger{% elif category == 'Education' %}bg-warning text-dark{% else %}bg-secondary{% endif %}">
-                                                    <strong class="fs-5">{{ category }}</strong>
-                                                    <span class="badge rounded-pill bg-dark float-end p-2 px-3">
-                                                        {{ cat_expenses|length }} expense{% if cat_expenses|length != 1 %}s{% endif %} - 
-                                                        ${{ "%.2f"|format(cat_expenses|sum(attribute='amount')) }}
-                                                    </span>
-                                                </td>
-                                            </tr>
-                                            {% for expense in cat_expenses %}
-                                                <tr>
-                                                    <td class="fw-medium">{{ expense.payer_name }}</td>
-                                                    <td>{{ expense.description }}</td>
-                                                    <td><span class="badge py-2 px-3 fs-6 {% if expense.category == 'Food' %}bg-success{% elif expense.category == 'Entertainment' %}bg-info{% elif expense.category == 'Transportation' %}bg-warning{% elif expense.category == 'Shopping' %}bg-danger{% elif expense.category == 'Travel' %}bg-primary{% elif expense.category == 'Utilities' %}bg-info{% elif expense.category == 'Rent' %}bg-dark{% elif expense.category == 'Health' %}bg-danger{% elif expense.category == 'Education' %}bg-warning text-dark{% else %}bg-secondary{% endif %}">{{ expense.category }}</span></td>
-                                                    <td class="fw-bold">${{ "%.2f"|format(expense.amount) }}</td>
-                                                    <td>{{ expense.date }}</td>
-                                                    <td>
-                                                        <form action="/expenses/delete" method="post" class="d-inline">
-                                                            <input type="hidden" name="expense_id" value="{{ expense.id }}">
-                                                            <button type="submit" class="btn btn-sm btn-danger" onclick="return confirm('Are you sure you want to delete this expense?')">
-                                                                <i class="fas fa-trash"></i>
-                                                            </button>
-                                                        </form>
-                                                    </td>
-                                                </tr>
-                                            {% endfor %}
-                                        {% endfor %}
-                                    {% else %}
-                                        <tr>
-                                            <td colspan="5" class="text-center text-muted py-3">No expenses recorded yet</td>
-                                        </tr>
-                                    {% endif %}
-                                </tbody>
-                            </table>
-                        </div>
-                    </div>
-                </div>
-
-                <div class="card">
-                    <div class="card-header">
-                        <h5 class="mb-0"><i class="fas fa-balance-scale me-2"></i>Balance Sheet</h5>
-                    </div>
-                    <div class="card-body">
-                        {% if balances %}
-                            <ul class="list-group" id="balanceList">
-                                {% for balance in balances %}
-                                    <li class="list-group-item d-flex justify-content-between align-items-center">
-                                        <span>
-                                            <strong>{{ balance.from_user }}</strong> owes 
-                                            <strong>{{ balance.to_user }}</strong>
-                                        </span>
-                                        <span class="badge bg-primary rounded-pill">${{ "%.2f"|format(balance.amount) }}</span>
-                                    </li>
-                                {% endfor %}
-                            </ul>
-                        {% else %}
-                            <p class="text-muted text-center mb-0">No balances to display</p>
-                        {% endif %}
-                    </div>
-                </div>
-
-                </div>
-        </div>
-    </div>
-
-    <footer class="footer mt-5 py-3 bg-dark">
-        <div class="container text-center">
-            <div class="mb-3">
-                <form action="/reset" method="post" class="d-inline">
-                    <button type="submit" class="btn btn-outline-danger" onclick="return confirm('Are you sure you want to reset all data? This will remove all users except you and clear all expenses.')">
-                        <i class="fas fa-redo me-1"></i> Reset All Data
-                    </button>
-                </form>
-            </div>
-            <span class="text-muted">SplitStack - Split expenses with friends</span><br>
-            <small class="text-muted mt-2">SplitStack is not affiliated with Splitwise. Just inspired by the same problem.</small>
-        </div>
-    </footer>
-
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <script src="{{ url_for('static', filename='js/analytics.js') }}"></script>
-    <script src="{{ url_for('static', filename='js/app.js') }}"></script>
-    <script src="{{ url_for('static', filename='js/pwa.js') }}"></script>
-</body>
-</html>
-"""
+# Badge/header colour for each category (anything else is bg-secondary)
+CATEGORY_CLASSES = {
+    'Food': 'bg-success',
+    'Entertainment': 'bg-info',
+    'Transportation': 'bg-warning',
+    'Shopping': 'bg-danger',
+    'Travel': 'bg-primary',
+    'Utilities': 'bg-info',
+    'Rent': 'bg-dark',
+    'Health': 'bg-danger',
+    'Education': 'bg-warning text-dark',
+}
+app.jinja_env.globals['category_classes'] = CATEGORY_CLASSES
+app.jinja_env.filters['money'] = format_cents
+
+# Rendered users panel and balance sheet, keyed by group and store version
+fragments = FragmentCache()
+
+# Live updates for open pages, streamed from /events. Each open stream
+# holds a thread unless the server runs gevent, so gunicorn.conf.py turns
+# them off (LIVE_UPDATES=0) under gthread: pages then post their forms and
+# reload as plain HTML pages do.
+app.config['LIVE_UPDATES'] = os.environ.get("LIVE_UPDATES", "1") == "1"
+broadcaster = Broadcaster()
+
+# Results of recent /api/batch operations by idempotency key, for retries
+idempotency = batch.IdempotencyCache(int(os.environ.get("IDEMPOTENCY_KEYS", "10000")))
+
+# Timings exposed on /metrics
+metrics = Metrics()
+metrics.describe('splitstack_request_seconds', 'Time to handle a request, until the response body starts')
+metrics.describe('splitstack_template_seconds', 'Time to render a template')
+metrics.describe('splitstack_balances_seconds', 'Time to turn net balances into settlements')
+metrics.describe('splitstack_export_seconds', 'Time to stream a whole CSV export')
+
+# Sampling profiler, controlled through /debug/profile when PROFILER=1
+app.config['PROFILER'] = os.environ.get("PROFILER") == "1"
+profiler = SamplingProfiler(float(os.environ.get("PROFILER_INTERVAL", "0.005")))
+
+def seed_sample_data(store):
+    # Add a default user and friends
+    default_user = store.add_user('You', is_current=True)
+    friend1 = store.add_user('Alex')
+    friend2 = store.add_user('Sam')
+
+    # Add some sample expenses with more diverse categories
+    store.bulk_add_expenses([
+        (friend1, 4575, 'Dinner at restaurant', 'Food'),
+        (default_user, 3050, 'Groceries', 'Food'),
+        (friend2, 2299, 'Movie tickets', 'Entertainment'),
+        (friend1, 80000, 'Apartment rent', 'Rent'),
+        (default_user, 3550, 'Uber ride', 'Transportation'),
+        (friend2, 9520, 'Electricity bill', 'Utilities'),
+        (friend1, 6575, 'New clothes', 'Shopping'),
+        (default_user, 4000, 'Pharmacy', 'Health'),
+    ])
+
+# Only seed an empty deployment, so a persistent database isn't seeded twice
+with app.app_context():
+    if groups.default() is None:
+        seed_sample_data(groups.create_group('Household'))
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_timing(response):
+    metrics.observe(
+        'splitstack_request_seconds', time.perf_counter() - g.request_started,
+        endpoint=request.endpoint or 'none', method=request.method, status=response.status_code
+    )
+    return response
+
+# Template timings, from Flask's render signals. Renders can nest (a
+# fragment rendered while building a page), hence the per-thread stack.
+_renders = threading.local()
+
+def _render_started(sender, template, context, **extra):
+    if not hasattr(_renders, 'stack'):
+        _renders.stack = []
+    _renders.stack.append(time.perf_counter())
+
+def _render_finished(sender, template, context, **extra):
+    started = _renders.stack.pop()
+    metrics.observe('splitstack_template_seconds', time.perf_counter() - started, template=template.name)
+
+before_render_template.connect(_render_started, app)
+template_rendered.connect(_render_finished, app)
+
+@app.after_request
+def compress_response(response):
+    if app.config['COMPRESS_RESPONSES']:
+        return compression.compress_response(response, request.accept_encodings)
+    return response
+
+# Static files
+
+@app.url_defaults
+def fingerprint_static(endpoint, values):
+    # url_for('static', filename='css/style.css') links the fingerprinted copy
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = assets.url_filename(values['filename'])
+
+@app.route('/static/<path:filename>', endpoint='static')
+def serve_static(filename):
+    # Precompressed copies from memory; fingerprinted names are cached for a
+    # year, plain names revalidated (see assets.py)
+    asset = assets.get(filename)
+    if asset is None:
+        abort(404)
+    encoding = compression.negotiate(request.accept_encodings, asset['encodings'])
+    etag = f"{asset['etag']}-{encoding}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(asset['encodings'][encoding], mimetype=asset['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = asset['cache_control']
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.before_request
+def load_group():
+    # The group comes from an explicit group_id (API clients) or the one
+    # picked in this browser session, falling back to the oldest group only
+    # when neither names one. An explicit group_id that doesn't resolve is a
+    # 404: a typo must not read, write or reset some other group.
+    # Static files need no group, and reading the session would add
+    # Vary: Cookie to responses meant for shared caches.
+    if request.endpoint == 'static':
+        return
+    group_id = request.args.get('group_id') or request.form.get('group_id')
+    if group_id:
+        g.store = groups.get(group_id)
+        if g.store is None:
+            if wants_json() or request.path.startswith('/api/'):
+                return jsonify({'error': 'Group not found'}), 404
+            abort(404)
+        return
+
+    # A session can outlive its group (an in-memory deployment restarted
+    # without DATA_DIR), so a stale one is forgotten
+    g.store = groups.get(session.get('group_id'))
+    if g.store is None:
+        if 'group_id' in session:
+            del session['group_id']
+        g.store = groups.default()
 
 @app.route('/')
 def index():
-    # Calculate balances
-    balances = calculate_balances()
-
-    return render_template_string(
-        HTML_TEMPLATE,
+    store = g.store
+    users_version, expenses_version = store.versions()
+    users = store.list_users()
+
+    # The users panel and balance sheet are only re-rendered when the data
+    # they depend on has changed
+    users_panel = fragments.get(
+        ('users_panel', store.group_id), users_version,
+        lambda: render_template('_users_panel.html', users=users)
+    )
+    balance_sheet = render_balance_sheet(store, (users_version, expenses_version))
+
+    # First page of each category; totals come precomputed from the store
+    expense_groups = []
+    for group in store.category_summaries():
+        group['expenses'], group['next_cursor'] = store.page_expenses(group['category'], limit=EXPENSE_PAGE_SIZE)
+        expense_groups.append(group)
+
+    return render_template(
+        'index.html',
+        group={'id': store.group_id, 'name': store.group_name},
+        groups=groups.list_groups(),
         users=users,
-        expenses=expenses,
-        balances=balances,
+        users_panel=users_panel,
+        balance_sheet=balance_sheet,
+        summary=store.expense_summary(),
+        expense_groups=expense_groups,
         expense_categories=expense_categories
     )
 
+def render_balance_sheet(store, versions):
+    users_version, expenses_version = versions
+    return fragments.get(
+        ('balance_sheet', store.group_id), (users_version, expenses_version, app.config['SETTLEMENT_MODE']),
+        lambda: render_template('_balance_sheet.html', balances=calculate_balances(store))
+    )
+
+# Live updates
+#
+# Mutations publish what changed to the group's open pages: an added or
+# deleted expense sends the row, the new category and overall totals and the
+# re-rendered balance sheet; anything that reshapes the page (members,
+# clear, reset, imports) just asks the pages to reload.
+
+def publish_reload():
+    broadcaster.publish(g.store.group_id, 'reload', {})
+
+def publish_expense(event, expense):
+    store = g.store
+    if not broadcaster.has_listeners(store.group_id):
+        # Nobody to render for; a page reconnecting later reloads instead
+        publish_reload()
+        return
+    versions = store.versions()
+    category = expense['category'] or 'Other'
+    totals = next(
+        (summary for summary in store.category_summaries() if summary['category'] == category),
+        {'category': category, 'count': 0, 'total_cents': 0}
+    )
+    data = {
+        # Pages ignore totals older than what they already show
+        'version': versions[1],
+        'id': expense['id'],
+        'category': totals,
+        'summary': store.expense_summary(),
+        'balances': render_balance_sheet(store, versions)
+    }
+    if event == 'expense_added':
+        data['row'] = render_template('_expense_rows.html', expenses=[expense])
+    broadcaster.publish(store.group_id, event, data)
+
+def wants_json():
+    # fetch() clients ask for JSON; plain form posts get flash + redirect
+    return request.accept_mimetypes.best == 'application/json'
+
+def respond(message, category, status=200, body=None):
+    # Ends a mutation route: 204 (or the body) / {'error': ...} for fetch
+    # clients, a flashed message and a redirect back to the page otherwise
+    if wants_json():
+        if category != 'success':
+            return jsonify({'error': message}), status
+        if body is None:
+            return '', 204
+        return jsonify(body), status
+    flash(message, category)
+    return redirect(url_for('index', group_id=g.store.group_id))
+
+@app.route('/events')
+def events():
+    # Server-Sent Events for the group's page. The stream does not need the
+    # request context, so none is kept alive for it. With live updates off,
+    # 204 tells EventSource to stop reconnecting (a page from before the
+    # switch).
+    if not app.config['LIVE_UPDATES']:
+        return '', 204
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    return Response(
+        broadcaster.listen(g.store.group_id, last_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/expenses/page')
+def expense_page():
+    # Next rows of one category, for the "Show more" button
+    category = request.args.get('category', 'Other')
+    try:
+        limit = max(1, min(int(request.args.get('limit', EXPENSE_PAGE_SIZE)), 500))
+    except ValueError:
+        limit = EXPENSE_PAGE_SIZE
+    expenses, next_cursor = g.store.page_expenses(category, request.args.get('cursor'), limit)
+    return jsonify({
+        'html': render_template('_expense_rows.html', expenses=expenses),
+        'next_cursor': next_cursor
+    })
+
+@app.route('/groups/add', methods=['POST'])
+def add_group():
+    name = request.form.get('name', '').strip()
+    if not name:
+        flash('Please enter a group name', 'danger')
+        return redirect(url_for('index'))
+
+    store = groups.create_group(name)
+    store.add_user('You', is_current=True)
+    session['group_id'] = store.group_id
+    flash(f'Group "{name}" created', 'success')
+    return redirect(url_for('index'))
+
+@app.route('/groups/switch', methods=['POST'])
+def switch_group():
+    # load_group has already resolved the posted group_id
+    session['group_id'] = g.store.group_id
+    return redirect(url_for('index'))
+
 @app.route('/users/add', methods=['POST'])
 def add_user():
     name = request.form.get('name', '').strip()
 
     if not name:
-        flash('Please enter a valid name', 'danger')
-        return redirect(url_for('index'))
+        return respond('Please enter a valid name', 'danger', 400)
 
-    # Check for user limit (10 users max)
-    if len(users) >= 10:
-        flash('Maximum number of users (10) reached. Please remove some users before adding more.', 'warning')
-        return redirect(url_for('index'))
+    # Check for the per-group user limit
+    limit = app.config['MAX_GROUP_MEMBERS']
+    if g.store.user_count() >= limit:
+        return respond(f'Maximum number of users ({limit}) reached. Please remove some users before adding more.', 'warning', 409)
 
-    # Check if user with this name already exists
-    if any(user['name'].lower() == name.lower() for user in users):
-        flash(f'User "{name}" already exists', 'warning')
-        return redirect(url_for('index'))
-
-    users.append({
-        'id': str(uuid.uuid4()),
-        'name': name,
-        'is_current': False
-    })
+    # The store rejects names that already exist
+    try:
+        g.store.add_user(name)
+    except ValueError as e:
+        return respond(str(e), 'warning', 409)
 
-    flash(f'User "{name}" added successfully', 'success')
-    return redirect(url_for('index'))
+    publish_reload()
+    return respond(f'User "{name}" added successfully', 'success')
 
 @app.route('/users/remove', methods=['POST'])
 def remove_user():
     user_id = request.form.get('user_id')
 
     # Find user
-    user = next((user for user in users if user['id'] == user_id), None)
+    user = g.store.get_user(user_id)
     if not user:
-        flash('User not found', 'danger')
-        return redirect(url_for('index'))
+        return respond('User not found', 'danger', 404)
 
-    # Check if user has expenses
-    if any(expense['payer_id'] == user_id for expense in expenses):
-        flash(f'Cannot remove {user["name"]} as they have recorded expenses', 'warning')
-        return redirect(url_for('index'))
-
-    # Remove user
-    users.remove(user)
-    flash(f'User "{user["name"]}" removed successfully', 'success')
-    return redirect(url_for('index'))
-
-@app.route('/expenses/add', methods=['POST'])
-def add_expense():
-    payer_id = request.form.get('payer_id')
-    amount_str = request.form.get('amount', '0')
-    description = request.form.get('description', '').strip()
-    category = request.form.get('category', 'Other')
+    # Remove user; refused while they are part of any expense
+    try:
+        g.store.remove_user(user_id)
+    except ValueError:
+        return respond(f'Cannot remove {user["name"]} as they are part of recorded expenses', 'warning', 409)
+    publish_reload()
+    return respond(f'User "{user["name"]}" removed successfully', 'success')
+
+def validate_expense(data):
+    # Shared by the form and JSON routes. Returns (expense args, error message).
+    # JSON can carry any type, so ids and names are checked to be strings
+    # before they reach the store.
+    if not isinstance(data, dict):
+        return None, 'Send the expense as a JSON object'
+    payer_id = data.get('payer_id')
+    amount_str = data.get('amount', '0')
+    description = str(data.get('description') or '').strip()
+    category = data.get('category') or 'Other'
+    split_type = data.get('split_type') or 'equal'
+    if not isinstance(payer_id, str):
+        return None, 'Selected user not found'
+    if not isinstance(category, str) or not isinstance(split_type, str):
+        return None, 'Category and split type must be strings'
 
     # Find payer
-    payer = next((user for user in users if user['id'] == payer_id), None)
+    payer = g.store.get_user(payer_id)
     if not payer:
-        flash('Selected user not found', 'danger')
-        return redirect(url_for('index'))
+        return None, 'Selected user not found'
 
     # Validate amount
     try:
-        amount = float(amount_str)
-        if amount <= 0:
+        amount_cents = parse_cents(amount_str)
+        if amount_cents <= 0:
             raise ValueError("Amount must be positive")
-    except ValueError:
-        flash('Please enter a valid positive amount', 'danger')
-        return redirect(url_for('index'))
+    except (TypeError, ValueError):
+        return None, 'Please enter a valid positive amount'
 
     # Validate description
     if not description:
-        flash('Please enter a description', 'danger')
-        return redirect(url_for('index'))
+        return None, 'Please enter a description'
 
-    # Add expense
-    from datetime import datetime
-    expenses.append({
-        'id': str(uuid.uuid4()),
-        'payer_id': payer_id,
-        'payer_name': payer['name'],
-        'amount': amount,
-        'description': description,
-        'category': category,
-        'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-    })
+    # Work out each participant's share; everyone splits equally by default
+    member_ids = [user['id'] for user in g.store.list_users()]
+    if hasattr(data, 'getlist'):
+        participants = data.getlist('participants')
+        values = {user_id: data.get(f'value_{user_id}') for user_id in member_ids}
+    else:
+        participants = data.get('participants')
+        values = data.get('values') or {}
+    if not participants:
+        participants = member_ids
+    if not isinstance(participants, list) or not all(isinstance(user_id, str) for user_id in participants):
+        return None, 'Split participants must be a list of user ids'
+    if not set(participants) <= set(member_ids):
+        return None, 'Split participants must be members of the group'
+    if not isinstance(values, dict):
+        return None, 'Split values must map user ids to numbers'
+    try:
+        splits = resolve_split(amount_cents, split_type, participants, values)
+    except ValueError as e:
+        return None, str(e)
 
-    flash('Expense added successfully', 'success')
-    return redirect(url_for('index'))
+    return (payer, amount_cents, description, category, None, splits), None
+
+@app.route('/expenses/add', methods=['POST'])
+def add_expense():
+    expense_args, error = validate_expense(request.form)
+    if error:
+        return respond(error, 'danger', 400)
+
+    # Add expense; fails if a member was removed in the meantime
+    try:
+        expense = g.store.add_expense(*expense_args)
+    except ValueError as e:
+        return respond(str(e), 'danger', 409)
+
+    publish_expense('expense_added', expense)
+    return respond('Expense added successfully', 'success', 201, expense)
+
+@app.route('/expenses/import', methods=['POST'])
+def import_expenses():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    # CSV unless the upload looks like JSON lines
+    fmt = request.form.get('format') or ('jsonl' if upload.filename.lower().endswith(('.json', '.jsonl')) else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': f'Unsupported format "{fmt}"'}), 400
+
+    # One lookup map for every payer referenced by the file
+    users_by_id = {user['id']: user for user in g.store.list_users()}
+    users_by_name = {user['name'].lower(): user for user in users_by_id.values()}
+
+    imported = 0
+    errors = []
+    rows = importer.iter_rows(upload.stream, fmt)
+    for batch in importer.iter_batches(rows, IMPORT_BATCH_SIZE):
+        items, batch_errors = importer.validate_batch(batch, users_by_id, users_by_name)
+        # Each batch goes to the store in a single call (one transaction for SQL)
+        try:
+            imported += len(g.store.bulk_add_expenses(items))
+        except ValueError as e:
+            # A payer was removed mid-import; the whole batch is rejected
+            batch_errors.append({'row': batch[0][0], 'error': str(e)})
+        errors.extend(batch_errors)
+
+    if imported:
+        publish_reload()
+    return jsonify({'imported': imported, 'failed': len(errors), 'errors': errors})
 
 @app.route('/expenses/delete', methods=['POST'])
 def delete_expense():
     expense_id = request.form.get('expense_id')
-    expense = next((exp for exp in expenses if exp['id'] == expense_id), None)
-    
-    if expense:
-        expenses.remove(expense)
-        flash('Expense deleted successfully', 'success')
-    else:
-        flash('Expense not found', 'danger')
-    
-    return redirect(url_for('index'))
+    expense = g.store.delete_expense(expense_id)
+    if not expense:
+        return respond('Expense not found', 'danger', 404)
+
+    publish_expense('expense_deleted', expense)
+    return respond('Expense deleted successfully', 'success')
 
 @app.route('/expenses/clear', methods=['POST'])
 def clear_expenses():
-    global expenses
-    expenses = []
-    flash('All expenses have been cleared', 'success')
-    return redirect(url_for('index'))
+    g.store.clear_expenses()
+    publish_reload()
+    return respond('All expenses have been cleared', 'success')
 
 @app.route('/reset', methods=['POST'])
 def reset_data():
-    global users, expenses
-
-    # Recreate default user
-    users = []
-    default_user = {
-        'id': str(uuid.uuid4()),
-        'name': 'You',
-        'is_current': True
-    }
-    users.append(default_user)
+    # Recreate default user and clear expenses
+    g.store.reset()
 
-    # Clear expenses
-    expenses = []
+    publish_reload()
+    return respond('All data has been reset', 'success')
 
-    flash('All data has been reset', 'success')
-    return redirect(url_for('index'))
+def parse_moment(value, end_of_day=False):
+    # YYYY-MM-DD or YYYY-MM-DDTHH:MM[:SS]. A bare date used as an end bound
+    # means the end of that day. Raises ValueError, also for dates the
+    # stores cannot turn into a timestamp (year 1, the end of year 9999).
+    try:
+        moment = datetime.fromisoformat(value)
+        if end_of_day and len(value) == 10:
+            moment += timedelta(days=1)
+        moment.timestamp()
+    except (OverflowError, OSError):
+        raise ValueError(f'Date out of range: {value}')
+    return moment
+
+def parse_range(args):
+    # ?start= (inclusive) and ?end= (inclusive day / exclusive moment) as
+    # datetimes for the stores' time-range queries
+    start = args.get('start') or None
+    end = args.get('end') or None
+    return (parse_moment(start) if start else None), (parse_moment(end, end_of_day=True) if end else None)
 
 @app.route('/export/csv')
 def export_csv():
-    # Create a CSV file in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Write header
-    writer.writerow(['Date', 'Paid By', 'Description', 'Category', 'Amount'])
-
-    # Write data
-    for expense in expenses:
-        writer.writerow([
-            expense['date'],
-            expense['payer_name'],
-            expense['description'],
-            expense.get('category', 'Other'),  # Using get in case some expenses don't have category
-            f"${expense['amount']:.2f}"
-        ])
-
-    # Create response
-    output.seek(0)
+    # Optional filters: ?start=YYYY-MM-DD&end=YYYY-MM-DD&category=...&payer_id=...
+    try:
+        start, end = parse_range(request.args)
+    except ValueError:
+        flash('Please use YYYY-MM-DD dates for the export range', 'danger')
+        return redirect(url_for('index', group_id=g.store.group_id))
+
+    expenses = g.store.iter_expenses(
+        start=start,
+        end=end,
+        category=request.args.get('category') or None,
+        payer_id=request.args.get('payer_id') or None
+    )
+    chunks = cooperative(iter_csv(expenses))
+
+    # Stream the rows out as they are formatted, optionally gzipped
+    if request.args.get('gzip'):
+        return Response(
+            stream_with_context(metrics.timed_iter('splitstack_export_seconds', gzip_chunks(chunks), format='csv.gz')),
+            mimetype="application/gzip",
+            headers={"Content-Disposition": "attachment;filename=splitstack_expenses.csv.gz"}
+        )
     return Response(
-        output,
+        stream_with_context(metrics.timed_iter('splitstack_export_seconds', chunks, format='csv')),
         mimetype="text/csv",
         headers={"Content-Disposition": "attachment;filename=splitstack_expenses.csv"}
     )
 
-def calculate_balances():
-    if not users or len(users) < 2 or not expenses:
+@metrics.timed('splitstack_balances_seconds')
+def calculate_balances(store, snapshot=None):
+    # Names and net balances (straight from the running ledger) are read in
+    # one go, so a member added or removed meanwhile cannot leave a balance
+    # without a name
+    names, net_balances = snapshot or store.balance_snapshot()
+    if len(names) < 2:
         return []
 
-    # Initialize dictionaries to track payments and debts
-    total_paid = {user['id']: 0 for user in users}
-    total_owed = {user['id']: 0 for user in users}
-
-    # Calculate total payments and debts
-    for expense in expenses:
-        # Add what the payer paid
-        total_paid[expense['payer_id']] += expense['amount']
-        
-        # Calculate each person's share of this expense
-        share_per_person = expense['amount'] / len(users)
-        
-        # Add what each person owes for this expense
-        for user in users:
-            total_owed[user['id']] += share_per_person
-
-    # Calculate net balance for each user
-    net_balances = {}
-    for user_id in total_paid:
-        net_balances[user_id] = total_paid[user_id] - total_owed[user_id]
-
-    # Separate into debtors and creditors
-    debtors = [(user_id, -balance) for user_id, balance in net_balances.items() if balance < -0.01]
-    creditors = [(user_id, balance) for user_id, balance in net_balances.items() if balance > 0.01]
-    
-    # Sort by amount (largest debts/credits first)
-    debtors.sort(key=lambda x: x[1], reverse=True)
-    creditors.sort(key=lambda x: x[1], reverse=True)
-
-    # Generate settlements
+    # Turn net balances into transfers with the configured engine
     settlements = []
-    for debtor_id, debt in debtors:
-        remaining_debt = debt
-        debtor_name = next(user['name'] for user in users if user['id'] == debtor_id)
-        
-        for creditor_id, credit in creditors:
-            if remaining_debt <= 0.01:  # Done with this debtor
-                break
-                
-            if credit <= 0.01:  # Skip creditors who are fully paid
-                continue
-                
-            creditor_name = next(user['name'] for user in users if user['id'] == creditor_id)
-            
-            # Calculate the settlement amount
-            settlement = min(remaining_debt, credit)
-            
-            if settlement > 0.01:  # Only add non-zero settlements
-                settlements.append({
-                    'from_user': debtor_name,
-                    'to_user': creditor_name,
-                    'amount': round(settlement, 2)  # Round to 2 decimal places
-                })
-            
-            # Update remaining amounts
-            remaining_debt -= settlement
-            creditors[creditors.index((creditor_id, credit))] = (creditor_id, credit - settlement)
+    for debtor_id, creditor_id, cents in settle(net_balances, app.config['SETTLEMENT_MODE']):
+        settlements.append({
+            'from_user': names[debtor_id],
+            'to_user': names[creditor_id],
+            'amount_cents': cents
+        })
 
     return settlements
+
+# JSON API
+#
+# GET endpoints carry an ETag built from the store version counters, so
+# polling clients can send If-None-Match and get a 304 without the server
+# building the response body.
+
+def conditional_json(etag, build):
+    # Weak comparison: a compressed response carries the ETag as W/"..."
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/groups')
+def api_groups():
+    return jsonify({'groups': groups.list_groups()})
+
+@app.route('/api/users')
+def api_users():
+    users_version, _ = g.store.versions()
+    return conditional_json(
+        f'users-{g.store.group_id}-{users_version}',
+        lambda: {'version': users_version, 'users': g.store.list_users()}
+    )
+
+@app.route('/api/expenses')
+def api_expenses():
+    users_version, expenses_version = g.store.versions()
+    since = request.args.get('since', type=int)
+    try:
+        start, end = parse_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Use YYYY-MM-DD or YYYY-MM-DDTHH:MM for start and end'}), 400
+
+    def build():
+        # ?start=&end= lists just that time range, in time order
+        if start or end:
+            expenses = list(g.store.iter_expenses(start=start, end=end))
+            return {'version': expenses_version, 'full': True, 'expenses': expenses, 'deleted': []}
+        # Delta sync: only what changed after ?since=<version>, when the
+        # store still remembers that far back
+        changes = g.store.expense_changes(since) if since is not None else None
+        if changes is None:
+            return {'version': expenses_version, 'full': True, 'expenses': g.store.list_expenses(), 'deleted': []}
+        changed, deleted = changes
+        return {'version': expenses_version, 'full': False, 'expenses': changed, 'deleted': deleted}
+
+    return conditional_json(
+        f'expenses-{g.store.group_id}-{users_version}-{expenses_version}-{since}-{start}-{end}', build
+    )
+
+@app.route('/api/expenses/search')
+def api_search_expenses():
+    # ?q= words to look for in descriptions (the last one also matches as a
+    # prefix), optional ?category= and ?payer_id= filters, and ?limit= for
+    # how many of the newest matches to return. Facet counts come along.
+    query = request.args.get('q', '')
+    category = request.args.get('category') or None
+    payer_id = request.args.get('payer_id') or None
+    try:
+        limit = max(1, min(int(request.args.get('limit', EXPENSE_PAGE_SIZE)), 200))
+    except ValueError:
+        limit = EXPENSE_PAGE_SIZE
+    users_version, expenses_version = g.store.versions()
+    key = hashlib.sha1(f'{query}|{category}|{payer_id}|{limit}'.encode()).hexdigest()
+    return conditional_json(
+        f'search-{g.store.group_id}-{users_version}-{expenses_version}-{key}',
+        lambda: {'version': expenses_version, **g.store.search(query, category, payer_id, limit)}
+    )
+
+@app.route('/api/expenses', methods=['POST'])
+def api_add_expense():
+    expense_args, error = validate_expense(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        expense = g.store.add_expense(*expense_args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    publish_expense('expense_added', expense)
+    return jsonify(expense), 201
+
+@app.route('/api/expenses/<expense_id>', methods=['DELETE'])
+def api_delete_expense(expense_id):
+    expense = g.store.delete_expense(expense_id)
+    if not expense:
+        return jsonify({'error': 'Expense not found'}), 404
+    publish_expense('expense_deleted', expense)
+    return '', 204
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    # {"operations": [...]} applied in order as one write; see batch.py for
+    # the operations and how idempotency keys are replayed
+    operations = (request.get_json(silent=True) or {}).get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Expected {"operations": [...]}'}), 400
+    if len(operations) > BATCH_SIZE_LIMIT:
+        return jsonify({'error': f'At most {BATCH_SIZE_LIMIT} operations per batch'}), 413
+
+    results = g.store.apply_batch(
+        [batch.parse_operation(op) for op in operations], idempotency, app.config['MAX_GROUP_MEMBERS']
+    )
+    applied = sum(1 for result in results if result['status'] < 300 and not result.get('replayed'))
+    if applied:
+        # One reload for the whole batch instead of an event per change
+        publish_reload()
+    return jsonify({
+        'applied': applied,
+        'failed': sum(1 for result in results if result['status'] >= 300),
+        'results': results
+    })
+
+def build_balances(snapshot):
+    return {'net_cents': snapshot[1], 'settlements': calculate_balances(g.store, snapshot)}
+
+@app.route('/api/balances')
+def api_balances():
+    # ?as_of=YYYY-MM-DD[THH:MM] gives the balances from the expenses up to then
+    users_version, expenses_version = g.store.versions()
+    as_of = request.args.get('as_of') or None
+    try:
+        before = parse_moment(as_of, end_of_day=True) if as_of else None
+    except ValueError:
+        return jsonify({'error': 'Use YYYY-MM-DD or YYYY-MM-DDTHH:MM for as_of'}), 400
+    return conditional_json(
+        f'balances-{g.store.group_id}-{users_version}-{expenses_version}-{app.config["SETTLEMENT_MODE"]}-{as_of}',
+        lambda: build_balances(g.store.balance_snapshot(before))
+    )
+
+# Statement points returned by one /api/balances/history request
+HISTORY_POINTS_LIMIT = 400
+
+@app.route('/api/balances/history')
+def api_balance_history():
+    # Balances and settlements at the close of each day, week or month from
+    # ?start= to ?end= (default today): ?period=month gives monthly
+    # statements. The stores answer each point from their nearest
+    # checkpoint, so a year of month ends costs twelve short replays.
+    users_version, expenses_version = g.store.versions()
+    period = request.args.get('period', 'month')
+    if period not in PERIODS:
+        return jsonify({'error': f'period must be one of {", ".join(PERIODS)}'}), 400
+    try:
+        start = parse_moment(request.args['start']).date()
+        end = parse_moment(request.args['end']).date() if request.args.get('end') else datetime.now().date()
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Use YYYY-MM-DD for start (required) and end'}), 400
+
+    # Each period's balances are those before the next one starts
+    closes = []
+    day = start
+    while day <= end:
+        try:
+            close = next_period_start(day, period)
+            parse_moment(close.isoformat())
+        except (OverflowError, ValueError):
+            return jsonify({'error': 'Use YYYY-MM-DD for start (required) and end'}), 400
+        closes.append((period_keys(day.isoformat())[period], close))
+        if len(closes) > HISTORY_POINTS_LIMIT:
+            return jsonify({'error': f'At most {HISTORY_POINTS_LIMIT} periods per request'}), 400
+        day = close
+
+    def build():
+        names, history = g.store.balance_history([
+            datetime.combine(close, datetime.min.time()) for _, close in closes
+        ])
+        return {'period': period, 'points': [
+            {
+                'period': label,
+                'as_of': close.isoformat(),
+                'net_cents': net,
+                'settlements': calculate_balances(g.store, (names, net))
+            }
+            for (label, close), net in zip(closes, history)
+        ]}
+
+    return conditional_json(
+        f'balance-history-{g.store.group_id}-{users_version}-{expenses_version}-{app.config["SETTLEMENT_MODE"]}'
+        f'-{period}-{start}-{end}',
+        build
+    )
+
+@app.route('/api/analytics')
+def api_analytics():
+    # Dashboard totals per category, payer and day/week/month, read from
+    # rollups the store keeps up to date on every write. ?start=&end=
+    # narrow it to a time range.
+    users_version, expenses_version = g.store.versions()
+    try:
+        start, end = parse_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Use YYYY-MM-DD or YYYY-MM-DDTHH:MM for start and end'}), 400
+    return conditional_json(
+        f'analytics-{g.store.group_id}-{users_version}-{expenses_version}-{start}-{end}',
+        lambda: {'version': expenses_version, **g.store.analytics(start, end)}
+    )
+
+@app.route('/ledger/check')
+def check_ledger():
+    # Compare the running ledger against a full recompute
+    mismatches = g.store.check_consistency()
+    if mismatches:
+        logging.warning('Ledger drifted from recomputed balances: %s', mismatches)
+    return jsonify({'consistent': not mismatches, 'mismatches': mismatches})
+
+# Monitoring
+
+@app.route('/metrics')
+def metrics_page():
+    # Prometheus text format: the timing histograms plus sizes and cache
+    # figures read at scrape time
+    sizes = groups.sizes()
+    samples = [
+        ('splitstack_groups', 'gauge', 'Groups', sizes['groups']),
+        ('splitstack_users', 'gauge', 'Members across all groups', sizes['users']),
+        ('splitstack_expenses', 'gauge', 'Expenses across all groups', sizes['expenses']),
+        ('splitstack_fragment_cache_hits_total', 'counter', 'Rendered fragments served from the cache', fragments.hits),
+        ('splitstack_fragment_cache_misses_total', 'counter', 'Fragments that had to be rendered', fragments.misses),
+        ('splitstack_fragment_cache_hit_ratio', 'gauge', 'Share of fragment lookups served from the cache',
+         fragments.hits / ((fragments.hits + fragments.misses) or 1)),
+        ('splitstack_live_listeners', 'gauge', 'Open /events streams', broadcaster.listeners),
+        ('splitstack_live_events_total', 'counter', 'Live update events published', broadcaster.published),
+        ('splitstack_idempotency_keys', 'gauge', 'Batch idempotency keys remembered', len(idempotency)),
+        ('splitstack_idempotency_replays_total', 'counter', 'Batch operations answered from a previous attempt',
+         idempotency.replays),
+    ]
+    log = getattr(groups, 'log', None)
+    if log is not None:
+        samples.append(('splitstack_wal_appends_total', 'counter', 'Records appended to the write-ahead log', log.appends))
+        samples.append(('splitstack_wal_fsyncs_total', 'counter', 'Write-ahead log fsyncs (group commits)', log.fsyncs))
+    return Response(metrics.render(samples), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile', methods=['GET', 'POST'])
+def debug_profile():
+    # POST action=start|stop|reset toggles the sampler. GET returns the
+    # collapsed stacks for a flame graph, or ?format=top for the functions
+    # most often running.
+    if not app.config['PROFILER']:
+        abort(404)
+    if request.method == 'POST':
+        action = request.form.get('action') or request.args.get('action')
+        if action == 'start':
+            profiler.start()
+        elif action == 'stop':
+            profiler.stop()
+        elif action == 'reset':
+            profiler.reset()
+        else:
+            return jsonify({'error': 'action must be start, stop or reset'}), 400
+        return jsonify(profiler.status())
+    if request.args.get('format') == 'top':
+        top = [{'function': name, 'samples': count} for name, count in profiler.top()]
+        return jsonify({**profiler.status(), 'top': top})
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server; production runs under gunicorn (gunicorn.conf.py).
+    # The debugger and reloader are opt-in: the reloader imports the app
+    # twice, which with DATA_DIR means two processes writing the same log.
+    # It also watches static/, whose files are read once at startup.
+    app.run(host='0.0.0.0', port=int(os.environ.get("PORT", "5000")), debug=os.environ.get("FLASK_DEBUG") == "1",
+            extra_files=assets.paths)
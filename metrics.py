@@ -0,0 +1,115 @@
+# In-process metrics in the Prometheus text format.
+#
+# Latency histograms are kept per (metric, labels) with fixed buckets, so
+# recording a timing is a bisect and two increments under a lock. Counters
+# and gauges are not stored here: the /metrics route reads them from the
+# stores, caches and log when it is scraped and passes them to render().
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}'
+        yield f'{name}_sum{_labels(labels)} {self.sum}'
+        yield f'{name}_count{_labels(labels)} {self.count}'
+
+
+class Metrics:
+    def __init__(self):
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        # Decorator form of timer()
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def timed_iter(self, name, chunks, **labels):
+        # Times a streamed body from the first chunk to the last
+        with self.timer(name, **labels):
+            yield from chunks
+
+    def render(self, samples=()):
+        # samples: (name, 'counter' or 'gauge', help, value), where value is a
+        # number or a list of (labels dict, number)
+        with self._lock:
+            histograms = sorted(
+                (key, (list(histogram.counts), histogram.sum, histogram.count))
+                for key, histogram in self._histograms.items()
+            )
+        lines = []
+        described = set()
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {self._help.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+            histogram = Histogram()
+            histogram.counts, histogram.sum, histogram.count = counts, total, count
+            lines.extend(histogram.lines(name, labels))
+        for name, kind, text, value in samples:
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if isinstance(value, list):
+                for labels, sample in value:
+                    lines.append(f'{name}{_labels(tuple(sorted(labels.items())))} {sample}')
+            else:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
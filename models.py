@@ -3,17 +3,78 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+class Group(db.Model):
+    id = db.Column(db.String(36), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
 class User(db.Model):
     id = db.Column(db.String(36), primary_key=True)
+    group_id = db.Column(db.String(36), db.ForeignKey('group.id'), nullable=False, index=True)
     name = db.Column(db.String(50), nullable=False)
     email = db.Column(db.String(120), unique=True)
     password_hash = db.Column(db.String(128))
+    is_current = db.Column(db.Boolean, nullable=False, default=False)
     expenses = db.relationship('Expense', backref='user', lazy=True)
 
+    # Case-insensitive name lookups for the duplicate check, per group
+    __table_args__ = (
+        db.Index('ix_user_group_name_lower', group_id, db.func.lower(name)),
+    )
+
 class Expense(db.Model):
     id = db.Column(db.String(36), primary_key=True)
-    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    group_id = db.Column(db.String(36), db.ForeignKey('group.id'), nullable=False)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False, index=True)
+    # Integer cents, so sums are exact
+    amount_cents = db.Column(db.BigInteger, nullable=False)
     description = db.Column(db.String(200))
-    category = db.Column(db.String(50))
-    date = db.Column(db.DateTime, default=datetime.utcnow)
+    category = db.Column(db.String(50), index=True)
+    date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    # Listing and aggregates always filter by group first
+    __table_args__ = (
+        db.Index('ix_expense_group_date', group_id, date, id),
+        db.Index('ix_expense_group_category', group_id, category),
+    )
+
+class ExpenseShare(db.Model):
+    # One row per participant of an expense: how many cents they owe
+    expense_id = db.Column(db.String(36), db.ForeignKey('expense.id'), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), primary_key=True, index=True)
+    group_id = db.Column(db.String(36), db.ForeignKey('group.id'), nullable=False, index=True)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+
+class ExpenseRollup(db.Model):
+    # Running count/total per bucket, kept up to date by every expense write.
+    # dimension is 'category', 'payer' (bucket = user id), 'day', 'week' or 'month'.
+    group_id = db.Column(db.String(36), db.ForeignKey('group.id'), primary_key=True)
+    dimension = db.Column(db.String(10), primary_key=True)
+    bucket = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+class BalanceDay(db.Model):
+    # Net balance change (paid - owed) of each member per calendar day,
+    # written in the same transaction as the expenses. Balances as of a
+    # moment add up the whole days before it and only read the expenses of
+    # its own day.
+    group_id = db.Column(db.String(36), db.ForeignKey('group.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), primary_key=True)
+    net_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+class ExpenseTerm(db.Model):
+    # Inverted index over expense descriptions, one row per word of each
+    # expense, written in the same transaction as the expense. The primary
+    # key serves exact and prefix (range) lookups within a group.
+    group_id = db.Column(db.String(36), db.ForeignKey('group.id'), primary_key=True)
+    term = db.Column(db.String(200), primary_key=True)
+    expense_id = db.Column(db.String(36), db.ForeignKey('expense.id'), primary_key=True, index=True)
+
+class DataVersion(db.Model):
+    # Per-group change counters, bumped in the same transaction as every
+    # write so all workers see when cached fragments go stale
+    group_id = db.Column(db.String(36), db.ForeignKey('group.id'), primary_key=True)
+    users = db.Column(db.Integer, nullable=False, default=0)
+    expenses = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,58 @@
+# Money helpers. All amounts are integer cents from parsing onwards, so
+# balance arithmetic is exact.
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+
+# Largest amount accepted, in cents: exact as a JavaScript number and well
+# inside the 64-bit amount columns
+MAX_CENTS = 2 ** 53
+
+
+def parse_cents(value):
+    # Accepts "12.34", "$1,234.50", 12.34 or 12; raises ValueError otherwise.
+    # JSON true/false are not amounts, although bool is an int subclass.
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid amount "{value}"')
+    if isinstance(value, int):
+        cents = value * 100
+    else:
+        try:
+            amount = Decimal(str(value).strip().lstrip('$').replace(',', ''))
+            if not amount.is_finite():
+                raise ValueError(f'Invalid amount "{value}"')
+            # quantize raises InvalidOperation past the context's precision
+            cents = int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+        except InvalidOperation:
+            raise ValueError(f'Invalid amount "{value}"')
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f'Amount "{value}" is too large')
+    return cents
+
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    whole, frac = divmod(abs(cents), 100)
+    return f'{sign}{whole}.{frac:02d}'
+
+
+def split_cents(total, weights):
+    # Largest-remainder split of `total` cents in proportion to `weights`.
+    # The parts always add up to exactly `total`; leftover cents go to the
+    # largest fractional remainders, ties broken by position.
+    weight_sum = sum(weights)
+    if not weight_sum:
+        raise ValueError('Cannot split across zero total weight')
+
+    parts = []
+    remainders = []
+    for index, weight in enumerate(weights):
+        part, remainder = divmod(total * weight, weight_sum)
+        parts.append(part)
+        remainders.append((-remainder, index))
+
+    leftover = total - sum(parts)
+    for _, index in sorted(remainders)[:leftover]:
+        parts[index] += 1
+    return parts
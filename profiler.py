@@ -0,0 +1,85 @@
+# Sampling profiler for a running server.
+#
+# While started, a background thread wakes every `interval` seconds, takes
+# the current stack of every other thread from sys._current_frames() and
+# counts it. Nothing is installed in the request threads themselves, so the
+# cost is one stack walk per thread per sample and the server runs at full
+# speed between samples. Results come out as collapsed stacks (one
+# "outer;inner;leaf count" line per distinct stack), the input format of
+# flamegraph.pl and speedscope, or as the functions most often on top.
+
+import os
+import sys
+import threading
+from collections import Counter
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                sampled.append(';'.join(reversed(names)))
+            with self._lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    def collapsed(self):
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def top(self, limit=20):
+        # (function, samples with it on top of the stack), most frequent first
+        leaves = Counter()
+        with self._lock:
+            for stack, count in self.stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(limit)
+
+    def status(self):
+        return {'running': self.running, 'interval': self.interval, 'samples': self.samples}
+
@@ -0,0 +1,103 @@
+# Running analytics rollups.
+#
+# Count and total per category, payer and day, ISO week and month, updated on
+# every expense add/delete like the balance ledger, so the analytics
+# endpoint reads O(buckets) figures instead of scanning every expense.
+
+from datetime import date, timedelta
+
+PERIODS = ('day', 'week', 'month')
+
+
+def period_keys(day):
+    # 'YYYY-MM-DD' -> {'day': 'YYYY-MM-DD', 'week': 'YYYY-Www', 'month': 'YYYY-MM'}
+    iso_year, iso_week, _ = date.fromisoformat(day).isocalendar()
+    return {'day': day, 'week': f'{iso_year}-W{iso_week:02d}', 'month': day[:7]}
+
+
+def next_period_start(day, period):
+    # First day of the day/week/month after the one `day` (a date) is in
+    if period == 'day':
+        return day + timedelta(days=1)
+    if period == 'week':
+        return day + timedelta(days=7 - day.weekday())
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _bump(table, key, amount_cents, sign):
+    totals = table.setdefault(key, {'count': 0, 'total_cents': 0})
+    totals['count'] += sign
+    totals['total_cents'] += sign * amount_cents
+    if not totals['count']:
+        del table[key]
+
+
+def _add(table, key, count, total_cents):
+    totals = table.setdefault(key, {'count': 0, 'total_cents': 0})
+    totals['count'] += count
+    totals['total_cents'] += total_cents
+
+
+def sorted_periods(table):
+    return [
+        {'period': key, 'count': totals['count'], 'total_cents': totals['total_cents']}
+        for key, totals in sorted(table.items())
+    ]
+
+
+class Rollups:
+    def __init__(self):
+        self.by_category = {}
+        self.by_payer = {}
+        self.by_period = {period: {} for period in PERIODS}
+
+    def record(self, expense, sign):
+        # sign is 1 for an added expense, -1 for a deleted one
+        amount_cents = expense['amount_cents']
+        _bump(self.by_category, expense['category'] or 'Other', amount_cents, sign)
+        _bump(self.by_payer, expense['payer_id'], amount_cents, sign)
+        for period, key in period_keys(expense['date'][:10]).items():
+            _bump(self.by_period[period], key, amount_cents, sign)
+
+    @classmethod
+    def from_totals(cls, categories, payers, days):
+        # Rollups from {key: (count, total_cents)} per category, payer id
+        # and 'YYYY-MM-DD' day, as ExpenseTable.totals() returns them
+        rollups = cls()
+        for category, (count, total_cents) in categories.items():
+            _add(rollups.by_category, category or 'Other', count, total_cents)
+        for payer_id, (count, total_cents) in payers.items():
+            _add(rollups.by_payer, payer_id, count, total_cents)
+        for day, (count, total_cents) in days.items():
+            for period, key in period_keys(day).items():
+                _add(rollups.by_period[period], key, count, total_cents)
+        return rollups
+
+    def table(self, dimension):
+        # 'category', 'payer' or a period, the layout the SQL rollup table uses
+        if dimension == 'category':
+            return self.by_category
+        if dimension == 'payer':
+            return self.by_payer
+        return self.by_period[dimension]
+
+    def tables(self):
+        for dimension in ('category', 'payer') + PERIODS:
+            yield dimension, self.table(dimension)
+
+    def categories(self):
+        # Largest first
+        return [
+            {'category': category, 'count': totals['count'], 'total_cents': totals['total_cents']}
+            for category, totals in sorted(self.by_category.items(), key=lambda item: -item[1]['total_cents'])
+        ]
+
+    def payers(self, names):
+        # Largest first
+        return [
+            {'user_id': user_id, 'name': names.get(user_id), 'count': totals['count'], 'total_cents': totals['total_cents']}
+            for user_id, totals in sorted(self.by_payer.items(), key=lambda item: -item[1]['total_cents'])
+        ]
+
+    def periods(self):
+        return {period: sorted_periods(table) for period, table in self.by_period.items()}
@@ -0,0 +1,132 @@
+# Inverted index over expense descriptions.
+#
+# Descriptions are split into lowercase word tokens. Each term maps to the
+# rows (positions in the owning ExpenseTable) whose description contains
+# it, in an array that only ever grows in row order, so every posting list
+# is already sorted and intersecting them is a binary search. Deleted rows
+# are not removed here: the table filters them out with its live-row flags,
+# and compaction builds a fresh index. A sorted vocabulary serves prefix
+# lookups with a bisect; new terms wait in a short list of their own so a
+# write does not re-sort the whole vocabulary.
+#
+# A query matches rows containing every term; the last term also matches
+# as a prefix, so results narrow as someone types.
+
+import re
+from array import array
+from bisect import bisect_left
+from itertools import chain
+
+from split_engine import np
+
+TOKEN = re.compile(r'\w+')
+
+# Sorts after any character that can appear in a term
+PREFIX_END = '\U0010ffff'
+
+MERGE_TERMS = 4096
+
+
+def tokenize(text):
+    # Distinct lowercase terms, in order of first appearance
+    return list(dict.fromkeys(TOKEN.findall((text or '').lower())))
+
+
+class SearchIndex:
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []
+        # Terms added since the vocabulary was sorted: a small sorted list,
+        # folded into the vocabulary once it grows past MERGE_TERMS, and the
+        # ones not looked up yet
+        self.recent = []
+        self.unsorted = []
+
+    def add(self, row, text):
+        for term in tokenize(text):
+            rows = self.postings.get(term)
+            if rows is None:
+                rows = self.postings[term] = array('q')
+                self.unsorted.append(term)
+            rows.append(row)
+
+    def _sort(self):
+        # Runs on lookups, so possibly in several readers at once (never
+        # during a write); each builds new lists and they agree on the result
+        recent = sorted(self.recent + self.unsorted)
+        if len(recent) > MERGE_TERMS:
+            self.vocabulary, recent = sorted(self.vocabulary + recent), []
+        self.recent, self.unsorted = recent, []
+
+    def _prefixed(self, prefix):
+        if self.unsorted:
+            self._sort()
+        terms = []
+        for vocabulary in (self.vocabulary, self.recent):
+            lo = bisect_left(vocabulary, prefix)
+            terms += vocabulary[lo:bisect_left(vocabulary, prefix + PREFIX_END, lo)]
+        return [self.postings[term] for term in terms]
+
+    def match(self, terms):
+        # Rows (live or not) matching all terms, the last as a prefix, in
+        # order: a sorted list, or an int64 array when NumPy is available
+        *exact, last = terms
+        nothing = [] if np is None else np.empty(0, dtype=np.int64)
+        lists = []
+        for term in exact:
+            rows = self.postings.get(term)
+            if rows is None:
+                return nothing
+            lists.append(rows)
+        prefixed = self._prefixed(last)
+        if not prefixed:
+            return nothing
+
+        if np is None:
+            matched = set().union(*prefixed)
+            for rows in lists:
+                matched.intersection_update(rows)
+            return sorted(matched)
+
+        # Posting arrays are read in place (no copy); the views are dropped
+        # before returning, so later appends can still resize them
+        if len(prefixed) == 1:
+            matched = np.frombuffer(prefixed[0], dtype=np.int64).copy()
+        else:
+            # A short prefix can cover thousands of rare terms: those are
+            # gathered in one pass, long lists are viewed directly
+            short, parts = [], []
+            for rows in prefixed:
+                if len(rows) < 1024:
+                    short.append(rows)
+                else:
+                    parts.append(np.frombuffer(rows, dtype=np.int64))
+            parts.append(np.fromiter(chain.from_iterable(short), dtype=np.int64))
+            matched = np.sort(np.concatenate(parts))
+            del parts
+            # The same row can sit under several of the terms
+            matched = matched[np.concatenate(([True], matched[1:] != matched[:-1]))]
+        # Each exact term narrows the candidates with a binary search into
+        # its sorted posting list, smallest lists first
+        for rows in sorted(lists, key=len):
+            if not len(matched):
+                break
+            posting = np.frombuffer(rows, dtype=np.int64)
+            found = np.searchsorted(posting, matched)
+            found[found == len(posting)] = 0
+            matched = matched[posting[found] == matched]
+            del posting
+        return matched
+
+def facets(category_counts, payer_counts, names):
+    # {category: count} and {payer_id: count} as the API lists them, largest first
+    return {
+        'category': [
+            {'category': category, 'count': count}
+            for category, count in sorted(category_counts.items(), key=lambda item: -item[1])
+        ],
+        'payer': [
+            {'user_id': user_id, 'name': names.get(user_id), 'count': count}
+            for user_id, count in sorted(payer_counts.items(), key=lambda item: -item[1])
+        ]
+    }
@@ -0,0 +1,178 @@
+# Debt simplification engines.
+#
+# Every engine takes a {user_id: net_cents} mapping (positive = is owed,
+# negative = owes) that sums to exactly zero, and returns a list of
+# (from_id, to_id, cents) transfers.
+
+import heapq
+import logging
+
+# Above this many non-zero balances the exact solver falls back to greedy
+MAX_EXACT_MEMBERS = 32
+# Bail out of the exact solver if the data has too many zero-sum subsets
+MAX_ZERO_SUM_SUBSETS = 200000
+# ... or if partitioning them looks at too many candidate groups. Few
+# subsets can still combine in exponentially many ways (repeated balance
+# patterns like 100, 200, -300), and this runs on every page view.
+MAX_PARTITION_STEPS = 200000
+
+
+class _SearchTooLarge(Exception):
+    pass
+
+
+def settle_greedy(net_balances):
+    # Repeatedly match the largest debtor with the largest creditor.
+    # Each step settles at least one side, so this is O(n log n).
+    debtors = [(value, user_id) for user_id, value in net_balances.items() if value < 0]
+    creditors = [(-value, user_id) for user_id, value in net_balances.items() if value > 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    transfers = []
+    while debtors and creditors:
+        debt, debtor_id = heapq.heappop(debtors)
+        credit, creditor_id = heapq.heappop(creditors)
+        amount = min(-debt, -credit)
+        transfers.append((debtor_id, creditor_id, amount))
+
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor_id))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor_id))
+
+    return transfers
+
+
+def _subset_sums(values):
+    sums = [0] * (1 << len(values))
+    for mask in range(1, len(sums)):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + values[low.bit_length() - 1]
+    return sums
+
+
+def _zero_sum_subsets(values):
+    # Meet in the middle: enumerate subset sums of each half and join the
+    # halves on opposite sums. Returns None if there are too many subsets.
+    half = len(values) // 2
+    left = _subset_sums(values[:half])
+    right = _subset_sums(values[half:])
+
+    right_by_sum = {}
+    for mask, total in enumerate(right):
+        right_by_sum.setdefault(total, []).append(mask)
+
+    subsets = []
+    for left_mask, total in enumerate(left):
+        for right_mask in right_by_sum.get(-total, ()):
+            mask = left_mask | (right_mask << half)
+            if mask:
+                subsets.append(mask)
+        if len(subsets) > MAX_ZERO_SUM_SUBSETS:
+            return None
+    return subsets
+
+
+def _max_zero_sum_partition(count, subsets):
+    # Split the full set into as many disjoint zero-sum groups as possible.
+    # Any remainder of a zero-sum set is itself zero-sum, so it is enough to
+    # always pick the group containing the lowest remaining member. Returns
+    # None once the search passes MAX_PARTITION_STEPS candidates.
+    by_low_bit = [[] for _ in range(count)]
+    for mask in subsets:
+        by_low_bit[(mask & -mask).bit_length() - 1].append(mask)
+
+    memo = {0: (0, ())}
+    steps = [0]
+
+    def best(remaining):
+        if remaining in memo:
+            return memo[remaining]
+        low = (remaining & -remaining).bit_length() - 1
+        candidates = by_low_bit[low]
+        steps[0] += len(candidates)
+        if steps[0] > MAX_PARTITION_STEPS:
+            raise _SearchTooLarge()
+        result = (0, ())
+        for mask in candidates:
+            if mask & remaining != mask:
+                continue
+            groups, rest = best(remaining ^ mask)
+            if groups + 1 > result[0]:
+                result = (groups + 1, (mask,) + rest)
+        memo[remaining] = result
+        return result
+
+    try:
+        return best((1 << count) - 1)[1]
+    except _SearchTooLarge:
+        return None
+
+
+def _no_worse_than_greedy(transfers, remaining, net_balances):
+    # Fallback when the exact search is too large. Settling the opposite
+    # pairs first can leave greedy a worse split of the rest than it finds
+    # on its own, so the shorter of the two is kept.
+    paired = transfers + settle_greedy(remaining)
+    greedy = settle_greedy(net_balances)
+    return greedy if len(greedy) < len(paired) else paired
+
+
+def settle_minimal(net_balances):
+    # Minimum number of transfers. A zero-sum group of k members can always
+    # be settled with k - 1 transfers, so the optimum is the number of
+    # members minus the largest number of disjoint zero-sum groups.
+
+    # Exactly opposite balances always form their own group of two
+    transfers = []
+    waiting = {}
+    remaining = {}
+    for user_id, value in sorted(net_balances.items(), key=lambda item: item[1]):
+        if not value:
+            continue
+        partners = waiting.get(-value)
+        if partners:
+            partner_id = partners.pop()
+            if value < 0:
+                transfers.append((user_id, partner_id, -value))
+            else:
+                transfers.append((partner_id, user_id, value))
+            del remaining[partner_id]
+        else:
+            waiting.setdefault(value, []).append(user_id)
+            remaining[user_id] = value
+
+    if len(remaining) > MAX_EXACT_MEMBERS:
+        logging.info('Too many members (%d) for exact settlement, using greedy', len(remaining))
+        return _no_worse_than_greedy(transfers, remaining, net_balances)
+
+    user_ids = list(remaining)
+    values = [remaining[user_id] for user_id in user_ids]
+    subsets = _zero_sum_subsets(values)
+    if subsets is None:
+        logging.info('Too many zero-sum subsets for exact settlement, using greedy')
+        return _no_worse_than_greedy(transfers, remaining, net_balances)
+
+    partition = _max_zero_sum_partition(len(values), subsets)
+    if partition is None:
+        logging.info('Zero-sum groups too many to partition exactly, using greedy')
+        return _no_worse_than_greedy(transfers, remaining, net_balances)
+    for mask in partition:
+        group = {user_ids[i]: values[i] for i in range(len(values)) if mask >> i & 1}
+        transfers.extend(settle_greedy(group))
+    return transfers
+
+
+SETTLEMENT_MODES = {
+    'greedy': settle_greedy,
+    'minimal': settle_minimal,
+}
+
+
+def settle(net_balances, mode='greedy'):
+    try:
+        engine = SETTLEMENT_MODES[mode]
+    except KeyError:
+        raise ValueError(f'Unknown settlement mode: {mode}')
+    return engine(net_balances)
@@ -0,0 +1,73 @@
+# Expense split rules and the batched balance computation.
+#
+# Every expense records how its amount is divided between participants as
+# {user_id: cents}. resolve_split() turns a split rule into that mapping at
+# creation time, so later membership changes never rewrite old expenses.
+#
+# compute_net_balances() recomputes every balance from scratch over expense
+# dicts with a plain loop: each dict has to be read one at a time anyway, and
+# copying them into NumPy columns first costs more than the loop itself.
+# Data already held in columns (expense_table.py) is reduced with NumPy
+# scatter-adds instead (reduce_columns).
+
+from money import parse_cents, split_cents
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SPLIT_TYPES = ('equal', 'exact', 'percentage', 'shares')
+
+
+def resolve_split(amount_cents, split_type, participants, values=None):
+    # participants: ordered user ids; values: {user_id: raw value} for the
+    # exact/percentage/shares rules. Raises ValueError on an invalid split.
+    if split_type not in SPLIT_TYPES:
+        raise ValueError(f'Unknown split type "{split_type}"')
+    participants = list(dict.fromkeys(participants))
+    if not participants:
+        raise ValueError('Select at least one person to split with')
+
+    if split_type == 'equal':
+        weights = [1] * len(participants)
+    else:
+        values = values or {}
+        try:
+            # Parsed as hundredths so "33.33" percent or "1.5" shares stay exact
+            weights = [parse_cents(values.get(user_id) or 0) for user_id in participants]
+        except ValueError:
+            raise ValueError('Split values must be numbers')
+        if any(weight < 0 for weight in weights):
+            raise ValueError('Split values cannot be negative')
+
+        if split_type == 'exact':
+            if sum(weights) != amount_cents:
+                raise ValueError('Exact amounts must add up to the expense amount')
+            return {user_id: cents for user_id, cents in zip(participants, weights) if cents}
+        if split_type == 'percentage' and sum(weights) != 10000:
+            raise ValueError('Percentages must add up to 100')
+        if not sum(weights):
+            raise ValueError('Shares must add up to more than zero')
+
+    parts = split_cents(amount_cents, weights)
+    return {user_id: cents for user_id, cents in zip(participants, parts) if cents}
+
+
+def reduce_columns(user_count, payers, amounts, share_users, share_cents):
+    # Net cents per user index: scatter-add what they paid, subtract their shares
+    net = np.zeros(user_count, dtype=np.int64)
+    np.add.at(net, payers, amounts)
+    np.subtract.at(net, share_users, share_cents)
+    return net
+
+
+def compute_net_balances(user_ids, expenses):
+    # Full recompute of {user_id: paid - owed} in cents for `user_ids`
+    index = {user_id: i for i, user_id in enumerate(user_ids)}
+    net = [0] * len(user_ids)
+    for expense in expenses:
+        net[index[expense['payer_id']]] += expense['amount_cents']
+        for user_id, cents in expense['splits'].items():
+            net[index[user_id]] -= cents
+    return dict(zip(user_ids, net))
@@ -0,0 +1,57 @@
+// Dashboard charts, drawn from the precomputed totals of /api/analytics
+(function () {
+    const card = document.getElementById('analytics');
+    if (!card || typeof Chart === 'undefined') {
+        return;
+    }
+
+    const periodSelect = document.getElementById('analyticsPeriod');
+    const charts = {};
+    let data = null;
+
+    function dollars(cents) {
+        return cents / 100;
+    }
+
+    function draw(id, type, labels, values, label) {
+        if (charts[id]) {
+            charts[id].data.labels = labels;
+            charts[id].data.datasets[0].data = values;
+            charts[id].update();
+            return;
+        }
+        charts[id] = new Chart(document.getElementById(id), {
+            type: type,
+            data: { labels: labels, datasets: [{ label: label, data: values }] },
+            options: { responsive: true, plugins: { legend: { display: type === 'doughnut' } } }
+        });
+    }
+
+    function render() {
+        if (!data) {
+            return;
+        }
+        draw('categoryChart', 'doughnut',
+            data.by_category.map(function (row) { return row.category; }),
+            data.by_category.map(function (row) { return dollars(row.total_cents); }),
+            'Spent');
+        draw('payerChart', 'bar',
+            data.by_payer.map(function (row) { return row.name; }),
+            data.by_payer.map(function (row) { return dollars(row.total_cents); }),
+            'Paid');
+        const periods = data.by_period[periodSelect.value];
+        draw('periodChart', 'line',
+            periods.map(function (row) { return row.period; }),
+            periods.map(function (row) { return dollars(row.total_cents); }),
+            'Spent');
+    }
+
+    fetch(card.dataset.url)
+        .then(function (response) { return response.json(); })
+        .then(function (body) {
+            data = body;
+            render();
+        });
+
+    periodSelect.addEventListener('change', render);
+})();
@@ -0,0 +1,30 @@
+// Load the next page of a category when "Show more" is clicked
+document.addEventListener('click', function (event) {
+    const button = event.target.closest('.load-more');
+    if (!button) {
+        return;
+    }
+
+    const params = new URLSearchParams({
+        group_id: document.body.dataset.groupId,
+        category: button.dataset.category,
+        cursor: button.dataset.cursor
+    });
+    button.disabled = true;
+
+    fetch('/expenses/page?' + params.toString())
+        .then(function (response) { return response.json(); })
+        .then(function (page) {
+            const row = button.closest('tr');
+            row.insertAdjacentHTML('beforebegin', page.html);
+            if (page.next_cursor) {
+                button.dataset.cursor = page.next_cursor;
+                button.disabled = false;
+            } else {
+                row.remove();
+            }
+        })
+        .catch(function () {
+            button.disabled = false;
+        });
+});
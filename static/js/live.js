@@ -0,0 +1,140 @@
+// Live updates: forms marked data-live are posted with fetch, and changes
+// made here or in other tabs arrive over /events and are patched into the page
+(function () {
+    const url = document.body.dataset.eventsUrl;
+    let source = null;
+    // Expenses version of the totals on screen; older events don't overwrite them
+    let version = 0;
+
+    function money(cents) {
+        const sign = cents < 0 ? '-' : '';
+        cents = Math.abs(cents);
+        return sign + Math.floor(cents / 100) + '.' + String(cents % 100).padStart(2, '0');
+    }
+
+    function plural(count) {
+        return count + ' expense' + (count !== 1 ? 's' : '');
+    }
+
+    function showMessage(text, category) {
+        const alert = document.createElement('div');
+        alert.className = 'alert alert-' + category + ' alert-dismissible fade show';
+        alert.setAttribute('role', 'alert');
+        alert.textContent = text;
+        const close = document.createElement('button');
+        close.type = 'button';
+        close.className = 'btn-close';
+        close.setAttribute('data-bs-dismiss', 'alert');
+        close.setAttribute('aria-label', 'Close');
+        alert.appendChild(close);
+        document.getElementById('liveMessages').replaceChildren(alert);
+    }
+
+    function reload() {
+        if (source) {
+            source.close();
+        }
+        // The page's own group, whichever one the session has moved on to
+        window.location.assign('/?group_id=' + encodeURIComponent(document.body.dataset.groupId));
+    }
+
+    function applyTotals(change) {
+        // Returns false when the page lacks the place to show them
+        const group = document.querySelector('tbody.expense-group[data-category="' + CSS.escape(change.category.category) + '"]');
+        const total = document.getElementById('summaryTotal');
+        const count = document.getElementById('summaryCount');
+        if (!group || !total || !count || !change.category.count || !change.summary.count) {
+            return false;
+        }
+        if (change.version < version) {
+            return true;
+        }
+        version = change.version;
+        group.querySelector('.category-total').textContent =
+            plural(change.category.count) + ' - $' + money(change.category.total_cents);
+        total.textContent = '$' + money(change.summary.total_cents);
+        count.textContent = plural(change.summary.count);
+        document.getElementById('balanceSheet').outerHTML = change.balances;
+        return true;
+    }
+
+    function onAdded(event) {
+        const change = JSON.parse(event.data);
+        if (!applyTotals(change)) {
+            reload();
+            return;
+        }
+        // Rows are oldest first; when more are still to load, the new one
+        // will come with them
+        const group = document.querySelector('tbody.expense-group[data-category="' + CSS.escape(change.category.category) + '"]');
+        if (!group.querySelector('.load-more-row') && !group.querySelector('[data-expense-id="' + CSS.escape(change.id) + '"]')) {
+            group.insertAdjacentHTML('beforeend', change.row);
+        }
+    }
+
+    function onDeleted(event) {
+        const change = JSON.parse(event.data);
+        if (!applyTotals(change)) {
+            reload();
+            return;
+        }
+        const row = document.querySelector('[data-expense-id="' + CSS.escape(change.id) + '"]');
+        if (row) {
+            row.remove();
+        }
+    }
+
+    function connect() {
+        source = new EventSource(url);
+        source.addEventListener('expense_added', onAdded);
+        source.addEventListener('expense_deleted', onDeleted);
+        source.addEventListener('reload', reload);
+    }
+
+    document.addEventListener('submit', function (event) {
+        const form = event.target;
+        if (!form.hasAttribute('data-live') || !source) {
+            return;
+        }
+        event.preventDefault();
+        const button = form.querySelector('[type="submit"]');
+        button.disabled = true;
+
+        fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: {'Accept': 'application/json'}
+        })
+            .then(function (response) {
+                if (response.ok) {
+                    // The page itself is updated by the event that follows
+                    if (form.action.endsWith('/expenses/add')) {
+                        form.reset();
+                        showMessage('Expense added successfully', 'success');
+                    }
+                    return;
+                }
+                return response.json().then(function (body) {
+                    showMessage(body.error, 'danger');
+                });
+            })
+            .catch(function () {
+                showMessage('Could not reach the server, please try again', 'danger');
+            })
+            .finally(function () {
+                button.disabled = false;
+            });
+    });
+
+    // Full-page form posts and navigation close the stream first, so a
+    // reload event for our own change doesn't interrupt them
+    window.addEventListener('beforeunload', function () {
+        if (source) {
+            source.close();
+        }
+    });
+
+    if (url && window.EventSource) {
+        connect();
+    }
+})();
@@ -0,0 +1,536 @@
+# In-memory repository for the users and expenses of one group.
+#
+# Users are kept in a dict keyed by id with a lowercase-name index. Expenses
+# live in a columnar ExpenseTable (see expense_table.py): typed arrays per
+# field instead of a dict per expense, read through ExpenseRow views that
+# behave like the old dicts. Both preserve insertion order, so listings come
+# out in the order things were added, and every lookup and delete done by
+# the routes is O(1).
+#
+# Each expense carries a 'timestamp' (seconds since the epoch); 'date' is
+# only its display form. A sorted list of (timestamp, id) keys over all
+# expenses serves time-range queries (listing, export and analytics) with a
+# bisect instead of a scan. Balances as of a moment come from checkpoints
+# along that timeline (see checkpoints.py). For the grouped
+# listing, each category also keeps running count/total figures and its own
+# sorted keys, so a page of a category is a bisect plus a slice however
+# large the category is.
+# Per-payer and per-day/week/month figures are kept the same way (see
+# rollups.py) for the analytics endpoint.
+#
+# Each expense stores its split as {user_id: cents}; when none is given the
+# amount is split equally between everyone in the group at that moment.
+#
+# A bounded journal of (expenses_version, expense_id) lets API clients ask
+# for just the expenses that changed since a version they already have.
+# Versions count up from the moment the store was built (in microseconds)
+# rather than from zero, so every version handed out before a restart is
+# below every one after it: a client's old ?since= gets a full reload and
+# an old ETag never matches the rebuilt data.
+#
+# Every public method runs under the store's readers-writer lock, so
+# concurrent requests never see a half-applied change. Writes only hold it
+# for the few index updates they make. Table rows are never modified once
+# added, and clear/reset/compaction swap in a fresh table rather than
+# changing the old one, so a streaming export can keep reading its snapshot
+# after the lock is released.
+#
+# With a write-ahead log attached (see wal.py) every mutation is also
+# appended to the log while the write lock is held, and the calling thread
+# waits for it to reach the disk after releasing the lock.
+
+import functools
+import time
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from datetime import datetime
+
+import batch
+from checkpoints import BalanceCheckpoints
+from expense_table import ExpenseTable
+from ledger import BalanceLedger, find_mismatches
+from rollups import Rollups
+from rwlock import ReadWriteLock
+from search_index import facets, tokenize
+from split_engine import resolve_split
+
+# Expense changes remembered for delta sync
+CHANGE_LOG_SIZE = 10000
+
+
+def _reads(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _writes(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.write():
+            result = method(self, *args, **kwargs)
+        if self.log is not None:
+            self.log.sync()
+        return result
+    return locked
+
+
+class InMemoryStore:
+    def __init__(self, group_id=None, group_name=None):
+        self.group_id = group_id
+        self.group_name = group_name
+        self.lock = ReadWriteLock()
+        self.users = {}
+        self.table = ExpenseTable()
+        self.users_by_name = {}
+        self.category_totals = {}
+        self.category_keys = {}
+        self.timeline = []
+        self.checkpoints = BalanceCheckpoints()
+        # user_id -> number of expenses the user paid for / has a share in
+        self.paid_counts = {}
+        self.share_counts = {}
+        self.total_cents = 0
+        self.rollups = Rollups()
+        self.ledger = BalanceLedger()
+        # Bumped on every change, used to invalidate cached fragments
+        self.users_version = self.expenses_version = time.time_ns() // 1000
+        self.changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self.changes_floor = self.expenses_version
+        # Write-ahead log, and the sequence number of this group's last record
+        self.log = None
+        self.log_seq = 0
+
+    def _log(self, op, **fields):
+        if self.log is not None:
+            self.log_seq = self.log.append({'op': op, 'group': self.group_id, **fields})
+
+    @_reads
+    def versions(self):
+        return self.users_version, self.expenses_version
+
+    def _record_change(self, expense_id):
+        self.expenses_version += 1
+        if len(self.changes) == self.changes.maxlen:
+            self.changes_floor = self.changes[0][0]
+        self.changes.append((self.expenses_version, expense_id))
+
+    def _forget_changes(self):
+        # After a clear/reset nothing older can be replayed
+        self.expenses_version += 1
+        self.changes.clear()
+        self.changes_floor = self.expenses_version
+
+    @_reads
+    def expense_changes(self, since):
+        # Returns (changed expenses, deleted ids) after version `since`, or
+        # None if the journal no longer reaches back that far
+        if since < self.changes_floor or since > self.expenses_version:
+            return None
+        seen = set()
+        changed = []
+        deleted = []
+        for version, expense_id in reversed(self.changes):
+            if version <= since:
+                break
+            if expense_id in seen:
+                continue
+            seen.add(expense_id)
+            expense = self.table.get(expense_id)
+            if expense is None:
+                deleted.append(expense_id)
+            else:
+                changed.append(expense)
+        changed.reverse()
+        return changed, deleted
+
+    # Users
+
+    @_reads
+    def list_users(self):
+        return list(self.users.values())
+
+    def user_count(self):
+        return len(self.users)
+
+    @_reads
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    @_writes
+    def add_user(self, name, is_current=False):
+        return self._add_user(name, is_current)
+
+    def _add_user(self, name, is_current=False, user_id=None):
+        if name.lower() in self.users_by_name:
+            raise ValueError(f'User "{name}" already exists')
+        user = {
+            'id': user_id or str(uuid.uuid4()),
+            'name': name,
+            'is_current': is_current
+        }
+        self.users[user['id']] = user
+        self.users_by_name[name.lower()] = user
+        self.paid_counts[user['id']] = 0
+        self.share_counts[user['id']] = 0
+        self.ledger.add_user(user['id'])
+        self.users_version += 1
+        self._log('add_user', id=user['id'], name=name, is_current=is_current)
+        return user
+
+    @_writes
+    def remove_user(self, user_id):
+        # Refuses (ValueError) while the user is part of any expense
+        if self._has_expenses(user_id):
+            raise ValueError(f'{self.users[user_id]["name"]} is part of recorded expenses')
+        return self._remove_user(user_id)
+
+    def _remove_user(self, user_id):
+        user = self.users.pop(user_id, None)
+        if user:
+            del self.users_by_name[user['name'].lower()]
+            del self.paid_counts[user_id]
+            del self.share_counts[user_id]
+            self.ledger.remove_user(user_id)
+            self.users_version += 1
+            self._log('remove_user', id=user_id)
+        return user
+
+    def _has_expenses(self, user_id):
+        # True if the user paid for or has a share in any expense
+        return bool(self.paid_counts.get(user_id) or self.share_counts.get(user_id))
+
+    # Expenses
+
+    @_reads
+    def list_expenses(self):
+        return list(self.table)
+
+    def _time_slice(self, keys, start, end):
+        # Keys with start <= timestamp < end; either bound may be None
+        lo = bisect_left(keys, (start.timestamp(),)) if start else 0
+        hi = bisect_left(keys, (end.timestamp(),)) if end else len(keys)
+        return keys[lo:hi]
+
+    def iter_expenses(self, start=None, end=None, category=None, payer_id=None):
+        # Lazily yields matching expenses in time order. start (inclusive)
+        # and end (exclusive) are datetimes, looked up in the sorted keys.
+        # Only taking the snapshot of keys needs the lock.
+        with self.lock.read():
+            table = self.table
+            keys = self.category_keys.get(category, []) if category else self.timeline
+            keys = self._time_slice(keys, start, end)
+
+        for _, expense_id in keys:
+            expense = table.get(expense_id)
+            if expense is None:
+                continue
+            if payer_id and expense['payer_id'] != payer_id:
+                continue
+            yield expense
+
+    def expense_count(self):
+        return len(self.table)
+
+    @_reads
+    def expense_summary(self):
+        return {'count': len(self.table), 'total_cents': self.total_cents}
+
+    @_reads
+    def category_summaries(self):
+        # Categories in the order they first appeared
+        return [
+            {'category': category, 'count': totals['count'], 'total_cents': totals['total_cents']}
+            for category, totals in self.category_totals.items()
+        ]
+
+    @_reads
+    def analytics(self, start=None, end=None):
+        # Totals per category, payer and period. The whole history comes
+        # from the running rollups; a time range is reduced from the columns,
+        # starting from its slice of the timeline.
+        rollups = self.rollups
+        if start or end:
+            rollups = Rollups.from_totals(*self.table.totals(
+                self._time_slice(self.timeline, start, end),
+                start.timestamp() if start else None, end.timestamp() if end else None
+            ))
+        categories = rollups.categories()
+        return {
+            'count': sum(row['count'] for row in categories),
+            'total_cents': sum(row['total_cents'] for row in categories),
+            'by_category': categories,
+            'by_payer': rollups.payers({user_id: user['name'] for user_id, user in self.users.items()}),
+            'by_period': rollups.periods()
+        }
+
+    @_reads
+    def search(self, query, category=None, payer_id=None, limit=50):
+        # Newest expenses whose description has every word of `query` (the
+        # last one as a prefix), with facet counts by category and payer
+        total, expenses, categories, payers = self.table.search(tokenize(query), category, payer_id, limit)
+        names = {user_id: user['name'] for user_id, user in self.users.items()}
+        return {'total': total, 'expenses': expenses, 'facets': facets(categories, payers, names)}
+
+    @_reads
+    def page_expenses(self, category, cursor=None, limit=50):
+        # Keyset pagination by (timestamp, id). Returns (expenses, next_cursor).
+        keys = self.category_keys.get(category, [])
+        start = 0
+        if cursor:
+            timestamp, _, expense_id = cursor.partition('|')
+            try:
+                start = bisect_right(keys, (float(timestamp), expense_id))
+            except ValueError:
+                start = 0
+        page = keys[start:start + limit]
+        next_cursor = None
+        if start + limit < len(keys):
+            next_cursor = '%r|%s' % page[-1]
+        return [self.table.get(expense_id) for _, expense_id in page], next_cursor
+
+    @_writes
+    def add_expense(self, payer, amount_cents, description, category, date=None, splits=None):
+        return self._add_expense(payer, amount_cents, description, category, date, splits)
+
+    def _check_members(self, payer, splits):
+        # Members may have been removed since the request was validated
+        if payer['id'] not in self.users or not self.users.keys() >= (splits or {}).keys():
+            raise ValueError('The expense refers to someone who is no longer in the group')
+
+    def _add_expense(self, payer, amount_cents, description, category, date=None, splits=None,
+                     expense_id=None, timestamp=None):
+        # expense_id/timestamp are only passed when replaying the log
+        self._check_members(payer, splits)
+        if splits is None:
+            splits = resolve_split(amount_cents, 'equal', list(self.users))
+        if timestamp is None:
+            timestamp = (date or datetime.now()).timestamp()
+        expense = self.table.append(
+            expense_id or str(uuid.uuid4()), payer['id'], payer['name'], amount_cents,
+            description, category, timestamp, splits
+        )
+        self.paid_counts[payer['id']] += 1
+        key = (timestamp, expense['id'])
+        position = bisect_left(self.timeline, key)
+        self.timeline.insert(position, key)
+        self.checkpoints.invalidate(position)
+        self._index_category(expense, 1)
+        self._count_shares(expense, 1)
+        self.rollups.record(expense, 1)
+        self.ledger.record_expense(payer['id'], amount_cents, splits)
+        self._record_change(expense['id'])
+        self._log(
+            'add_expense', id=expense['id'], payer_id=payer['id'], amount_cents=amount_cents,
+            description=description, category=category, timestamp=timestamp, splits=splits
+        )
+        return expense
+
+    @_writes
+    def bulk_add_expenses(self, items):
+        # items: iterable of (payer, amount_cents, description, category[, date[, splits]]).
+        # Applied as one write, so readers see all of the batch or none of it.
+        items = list(items)
+        for payer, *rest in items:
+            self._check_members(payer, rest[4] if len(rest) > 4 else None)
+        return [self._add_expense(*item) for item in items]
+
+    @_writes
+    def delete_expense(self, expense_id):
+        return self._delete_expense(expense_id)
+
+    def _delete_expense(self, expense_id):
+        expense = self.table.remove(expense_id)
+        if expense:
+            self.paid_counts[expense['payer_id']] -= 1
+            key = (expense['timestamp'], expense_id)
+            position = bisect_left(self.timeline, key)
+            del self.timeline[position]
+            self.checkpoints.invalidate(position)
+            self._index_category(expense, -1)
+            self._count_shares(expense, -1)
+            self.rollups.record(expense, -1)
+            self.ledger.remove_expense(expense['payer_id'], expense['amount_cents'], expense['splits'])
+            self._record_change(expense_id)
+            self._log('delete_expense', id=expense_id)
+            if self.table.needs_compaction():
+                self.table = self.table.compacted()
+        return expense
+
+    def _count_shares(self, expense, sign):
+        self.total_cents += sign * expense['amount_cents']
+        for user_id in expense['splits']:
+            self.share_counts[user_id] += sign
+
+    def _index_category(self, expense, sign):
+        category = expense['category'] or 'Other'
+        key = (expense['timestamp'], expense['id'])
+        if sign > 0:
+            totals = self.category_totals.setdefault(category, {'count': 0, 'total_cents': 0})
+            insort(self.category_keys.setdefault(category, []), key)
+        else:
+            totals = self.category_totals[category]
+            keys = self.category_keys[category]
+            del keys[bisect_right(keys, key) - 1]
+        totals['count'] += sign
+        totals['total_cents'] += sign * expense['amount_cents']
+        if not totals['count']:
+            del self.category_totals[category]
+            del self.category_keys[category]
+
+    @_writes
+    def clear_expenses(self):
+        self._clear_expenses()
+
+    def _clear_expenses(self):
+        self.table = ExpenseTable()
+        self.paid_counts = dict.fromkeys(self.users, 0)
+        self.share_counts = dict.fromkeys(self.users, 0)
+        self.category_totals = {}
+        self.category_keys = {}
+        self.timeline = []
+        self.checkpoints = BalanceCheckpoints()
+        self.total_cents = 0
+        self.rollups = Rollups()
+        self.ledger.clear_expenses()
+        self._forget_changes()
+        self._log('clear_expenses')
+
+    @_writes
+    def reset(self):
+        # Drop everything and start over with just the current user
+        self._reset()
+        return self._add_user('You', is_current=True)
+
+    def _reset(self):
+        self.users = {}
+        self.users_by_name = {}
+        self.table = ExpenseTable()
+        self.paid_counts = {}
+        self.share_counts = {}
+        self.category_totals = {}
+        self.category_keys = {}
+        self.timeline = []
+        self.checkpoints = BalanceCheckpoints()
+        self.total_cents = 0
+        self.rollups = Rollups()
+        self.ledger.reset([])
+        self._forget_changes()
+        self._log('reset')
+
+    # Batches
+
+    @_writes
+    def apply_batch(self, operations, cache, max_members):
+        # Parsed /api/batch operations (see batch.py) applied under a single
+        # write lock, with one log sync for the whole batch. Keys are cached
+        # before the lock is released, so a concurrent retry finds them.
+        results, answered = batch.run(
+            self.group_id, operations, cache, lambda op: self._apply_operation(op, max_members)
+        )
+        for key, result in answered.items():
+            cache.put((self.group_id, key), result)
+        return results
+
+    def _apply_operation(self, op, max_members):
+        kind = op['op']
+        if kind == 'add_user':
+            if len(self.users) >= max_members:
+                return batch.failure(409, f'Maximum number of users ({max_members}) reached')
+            try:
+                return {'status': 201, 'user': self._add_user(op['name'])}
+            except ValueError as e:
+                return batch.failure(409, str(e))
+        if kind == 'remove_user':
+            user = self.users.get(op['user_id'])
+            if user is None:
+                return batch.failure(404, 'User not found')
+            if self._has_expenses(user['id']):
+                return batch.failure(409, f'Cannot remove {user["name"]} as they are part of recorded expenses')
+            return {'status': 200, 'user': self._remove_user(user['id'])}
+        if kind == 'add_expense':
+            try:
+                args = batch.expense_args(op, self.users, list(self.users))
+            except ValueError as e:
+                return batch.failure(400, str(e))
+            return {'status': 201, 'expense': dict(self._add_expense(*args))}
+        expense = self._delete_expense(op['expense_id'])
+        if expense is None:
+            return batch.failure(404, 'Expense not found')
+        return {'status': 200, 'expense': dict(expense)}
+
+    # Balances
+
+    @_reads
+    def balance_snapshot(self, before=None):
+        # Member names and net balances read together, so every balance has
+        # a name. With `before` (a datetime), only earlier expenses count.
+        names = {user_id: user['name'] for user_id, user in self.users.items()}
+        if before is None:
+            return names, self.ledger.net_balances()
+        return names, self._net_balances_before(before)
+
+    def _net_balances_before(self, moment):
+        # Nearest checkpoint plus the few expenses after it
+        position = bisect_left(self.timeline, (moment.timestamp(),))
+        net = self.checkpoints.net_before(self.table, self.timeline, position)
+        return {user_id: net.get(user_id, 0) for user_id in self.users}
+
+    @_reads
+    def balance_history(self, moments):
+        # Member names and the net balances before each moment, read together
+        names = {user_id: user['name'] for user_id, user in self.users.items()}
+        return names, [self._net_balances_before(moment) for moment in moments]
+
+    @_reads
+    def check_consistency(self):
+        # The running ledger against a full reduction over the columns
+        return find_mismatches(self.table.net_balances(list(self.users)), self.ledger.net_balances())
+
+    # Durability
+
+    @_reads
+    def dump(self):
+        # Everything needed to rebuild this group, for a snapshot
+        return {
+            'id': self.group_id,
+            'name': self.group_name,
+            'seq': self.log_seq,
+            'users': list(self.users.values()),
+            'expenses': [dict(expense) for expense in self.table]
+        }
+
+    def load(self, dump):
+        # Rebuilds an empty store from dump(); startup only, before any
+        # log is attached
+        for user in dump['users']:
+            self._add_user(user['name'], user['is_current'], user['id'])
+        for expense in dump['expenses']:
+            self._add_expense(
+                self.users[expense['payer_id']], expense['amount_cents'], expense['description'],
+                expense['category'], splits=expense['splits'], expense_id=expense['id'], timestamp=expense['timestamp']
+            )
+        self.log_seq = dump['seq']
+
+    def apply(self, record):
+        # Replays one logged mutation; startup only, before any log is attached
+        op = record['op']
+        if op == 'add_user':
+            self._add_user(record['name'], record['is_current'], record['id'])
+        elif op == 'remove_user':
+            self._remove_user(record['id'])
+        elif op == 'add_expense':
+            self._add_expense(
+                self.users[record['payer_id']], record['amount_cents'], record['description'],
+                record['category'], splits=record['splits'], expense_id=record['id'], timestamp=record['timestamp']
+            )
+        elif op == 'delete_expense':
+            self._delete_expense(record['id'])
+        elif op == 'clear_expenses':
+            self._clear_expenses()
+        elif op == 'reset':
+            self._reset()
+        self.log_seq = record['seq']
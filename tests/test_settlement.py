@@ -0,0 +1,40 @@
+import random
+
+import settlement
+from settlement import settle_greedy, settle_minimal
+
+
+def settles(net_balances, transfers):
+    net = dict.fromkeys(net_balances, 0)
+    for debtor_id, creditor_id, cents in transfers:
+        assert cents > 0
+        net[debtor_id] += cents
+        net[creditor_id] -= cents
+    return all(net[user_id] == -value for user_id, value in net_balances.items())
+
+
+def test_fallback_is_never_worse_than_greedy(monkeypatch):
+    # Pairing the opposite balances first leaves greedy 19 transfers here,
+    # where greedy alone needs 18
+    monkeypatch.setattr(settlement, 'MAX_EXACT_MEMBERS', 0)
+    values = [-400, -300, -700, -400, 700, -400, -400, 700, -400, -400, -300, -400,
+              -700, -400, 700, -400, -300, -300, -300, 700, -400, -700, 4800]
+    net_balances = {f'u{i:02d}': value for i, value in enumerate(values)}
+    transfers = settle_minimal(net_balances)
+    assert settles(net_balances, transfers)
+    assert len(transfers) <= len(settle_greedy(net_balances))
+
+
+def test_minimal_never_uses_more_transfers_than_greedy(monkeypatch):
+    # Repeated values are what make the exact search give up
+    rng = random.Random(7)
+    for cap in (settlement.MAX_EXACT_MEMBERS, 0):
+        monkeypatch.setattr(settlement, 'MAX_EXACT_MEMBERS', cap)
+        for _ in range(300):
+            pool = [rng.randrange(1, 12) * 100 * rng.choice((1, -1)) for _ in range(4)]
+            values = [rng.choice(pool) for _ in range(rng.randrange(3, 30))]
+            values.append(-sum(values))
+            net_balances = {f'u{i:02d}': value for i, value in enumerate(values)}
+            transfers = settle_minimal(net_balances)
+            assert settles(net_balances, transfers)
+            assert len(transfers) <= len(settle_greedy(net_balances))
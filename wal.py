@@ -0,0 +1,177 @@
+# Append-only write-ahead log and snapshots for the in-memory stores.
+#
+# Every mutation is appended as one JSON line carrying a global sequence
+# number. A background thread writes and fsyncs whatever has been appended
+# since its last pass, so concurrent writers share one fsync (group commit)
+# and each writer only waits until its own record is on disk.
+#
+# The log is split into segment files. A snapshot first switches appends to
+# a fresh segment, then dumps every group, and only then deletes the older
+# segments: everything in them is already covered by the dump. On startup
+# the snapshot is loaded and the remaining segments replayed in order.
+#
+# Layout of the data directory:
+#     snapshot.json          latest snapshot, replaced atomically
+#     wal-000001.jsonl ...   log segments, oldest first
+
+import json
+import os
+import threading
+
+SNAPSHOT_FILE = 'snapshot.json'
+
+
+class WriteAheadLog:
+    def __init__(self, directory, snapshot_every=50000):
+        self.directory = directory
+        # Records in the current segment that trigger a snapshot
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._seq = 0
+        self._synced = 0
+        self._segment_records = 0
+        self._local = threading.local()
+        # Counters for monitoring how well writes are batched
+        self.appends = 0
+        self.fsyncs = 0
+        self._closed = False
+        self._segments = self._list_segments()
+        self._file = None
+
+        self._flusher = threading.Thread(target=self._flush_loop, name='wal-flush', daemon=True)
+
+    def _list_segments(self):
+        names = [name for name in os.listdir(self.directory) if name.startswith('wal-') and name.endswith('.jsonl')]
+        return sorted(os.path.join(self.directory, name) for name in names)
+
+    def _open_segment(self):
+        number = 1
+        if self._segments:
+            number = int(os.path.basename(self._segments[-1])[4:-6]) + 1
+        path = os.path.join(self.directory, f'wal-{number:06d}.jsonl')
+        self._segments.append(path)
+        self._segment_records = 0
+        return open(path, 'a', encoding='utf-8')
+
+    # Startup
+
+    def read_snapshot(self):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+        self._seq = max(self._seq, snapshot.get('seq', 0))
+        return snapshot
+
+    def records(self):
+        # Yields the logged records oldest first. A torn last line (crash
+        # mid-write) ends its segment.
+        for path in list(self._segments):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self._seq = max(self._seq, record['seq'])
+                    yield record
+
+    def start(self):
+        # Call once replay is done; appends always go to a new segment
+        self._synced = self._seq
+        self._file = self._open_segment()
+        self._flusher.start()
+
+    # Writing
+
+    def append(self, record):
+        # Queues a record and returns its sequence number. Callers must
+        # serialise appends for the same group themselves.
+        with self._cond:
+            self._seq += 1
+            record['seq'] = self._seq
+            self._buffer.append(json.dumps(record, separators=(',', ':')) + '\n')
+            self._segment_records += 1
+            self.appends += 1
+            self._local.seq = self._seq
+            self._cond.notify_all()
+            return self._seq
+
+    def sync(self):
+        # Blocks until everything this thread appended is on disk
+        seq = getattr(self._local, 'seq', 0)
+        with self._cond:
+            while self._synced < seq:
+                self._cond.wait()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                lines, self._buffer = self._buffer, []
+                seq = self._seq
+                f = self._file
+            f.write(''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+            with self._cond:
+                self._synced = seq
+                self.fsyncs += 1
+                self._cond.notify_all()
+
+    def wait_until_full(self):
+        # Blocks until the current segment has grown enough for a snapshot
+        with self._cond:
+            while self._segment_records < self.snapshot_every and not self._closed:
+                self._cond.wait()
+            return not self._closed
+
+    # Snapshots
+
+    def rotate(self):
+        # Sends new appends to a fresh segment and returns the older segment
+        # paths together with the last sequence number they contain
+        with self._cond:
+            while self._synced < self._seq:
+                self._cond.wait()
+            self._file.close()
+            old = list(self._segments)
+            self._file = self._open_segment()
+            return old, self._seq
+
+    def write_snapshot(self, snapshot):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.directory, os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def remove_segments(self, paths):
+        with self._cond:
+            self._segments = [path for path in self._segments if path not in paths]
+        for path in paths:
+            os.remove(path)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher.is_alive():
+            self._flusher.join()
+        if self._file:
+            self._file.close()